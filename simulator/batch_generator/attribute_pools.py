@@ -0,0 +1,86 @@
+import math
+import os
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import faker
+from faker import Faker
+
+# Faker is called once per pool entry, never per row: rows draw from the pools by index.
+CACHE_DIR = Path(__file__).resolve().parent / ".pool_cache"
+NAME_POOL_SIZE = 50_000  # Names may repeat, so a fixed pool is enough at any scale
+
+PROVIDERS = {
+    "name": "name",
+    "phone": "phone_number",
+    "plate": "license_plate",
+}
+# Unique values are a Faker prefix plus a fixed-width serial. The prefix pool has a fixed
+# size, so it does not grow (or get refilled) with the row count; rows map to
+# (prefix, serial) pairs through a bijection, see sample_unique.
+UNIQUE_PREFIXES = {
+    "phone": ("numerify", "+1-%##-%##-"),  # Area code and exchange; the serial is the line number
+    "plate": ("bothify", "???-#"),
+}
+PREFIX_POOL_SIZE = 1_000
+SERIAL_DIGITS = 4
+MAX_DRAWS = 20  # Faker draws allowed per distinct prefix before giving up
+
+_loaded = {}  # In-process memo on top of the disk cache
+
+def _fill(kind, size, seed, unique):
+    fake = Faker()
+    fake.seed_instance(seed)
+    if not unique:
+        provider = getattr(fake, PROVIDERS[kind])
+        return np.array([provider() for _ in range(size)], dtype=object)
+    method, template = UNIQUE_PREFIXES[kind]
+    draw = getattr(fake, method)
+    values = {}  # Insertion-ordered set keeps the pool deterministic
+    for _ in range(size * MAX_DRAWS):
+        values.setdefault(draw(template).upper(), None)
+        if len(values) == size:
+            return np.array(list(values), dtype=object)
+    raise RuntimeError(f"Only {len(values)} distinct {kind} prefixes in {size * MAX_DRAWS} draws")
+
+def load_pool(kind, size, seed=42, unique=False, cache_dir=CACHE_DIR):
+    # unique: size is the rows to cover; the prefix pool only grows past PREFIX_POOL_SIZE
+    # prefixes beyond PREFIX_POOL_SIZE * 10**SERIAL_DIGITS rows
+    if unique:
+        size = max(PREFIX_POOL_SIZE, math.ceil(size / 10 ** SERIAL_DIGITS))
+    # Faker output changes between releases, so its version is part of the key
+    key = f"{kind}-{size}-{seed}-{'prefix' if unique else 'r'}-{faker.VERSION}"
+    if key in _loaded:
+        return _loaded[key]
+    path = Path(cache_dir) / f"{key}.parquet"
+    if path.exists():
+        values = pq.read_table(path)["value"].to_numpy(zero_copy_only=False)
+    else:
+        values = _fill(kind, size, seed, unique)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")  # Atomic publish; concurrent workers may race
+        pq.write_table(pa.table({"value": values}), tmp)
+        os.replace(tmp, path)
+    _loaded[key] = values
+    return values
+
+def sample(pool, rng, n):
+    # With replacement: vectorized index draw
+    return pool[rng.integers(0, len(pool), n)]
+
+def sample_unique(pool, first_idx, n, seed=42):
+    # pool: distinct prefixes from load_pool(..., unique=True). Rows first_idx..first_idx+n-1
+    # map through a seeded affine bijection onto (prefix, serial) pairs, so rows never share
+    # a value even across independently generated shards.
+    size = len(pool) * 10 ** SERIAL_DIGITS
+    assert first_idx + n <= size, "Unique pool smaller than row count!"
+    rng = np.random.default_rng(seed)
+    a = int(rng.integers(1, max(size, 2)))
+    while math.gcd(a, size) != 1:
+        a = a % (size - 1) + 1
+    b = int(rng.integers(0, size))
+    rows = np.arange(first_idx, first_idx + n, dtype=np.int64)
+    pairs = (a * rows + b) % size
+    serials = np.char.zfill((pairs // len(pool)).astype(str), SERIAL_DIGITS)
+    return np.char.add(pool[pairs % len(pool)].astype(str), serials).astype(object)
@@ -1,51 +1,76 @@
+import numpy as np
 import pandas as pd
-import random
-from faker import Faker
 from vehicles import generate_vehicles  # For pool
 from zones import generate_zones  # For zone pool
+from sharding import shard_bounds, shard_seeds, prefixed_ids, SHARD_SIZES
+from attribute_pools import load_pool, sample, sample_unique, NAME_POOL_SIZE
 
-fake = Faker()
+SHARD_SIZE = SHARD_SIZES["drivers"]
 
-def generate_drivers(n_drivers=10_000, vehicle_pool=None, zone_pool=None, seed=42):
+def driver_ids(n_drivers):
+    return list(prefixed_ids("D", 0, n_drivers, 6))
+
+def load_driver_pools(n_drivers, seed=42):
+    # Unique phones: a fixed-size prefix pool, expanded to one prefix + serial per row by sample_unique
+    return load_pool("name", NAME_POOL_SIZE, seed), load_pool("phone", n_drivers, seed + 1, unique=True)
+
+def _driver_shard(first_idx, n, vehicle_pool, zone_ids, seed_seq, as_of, pools, seed):
+    rng = np.random.default_rng(seed_seq)
+    names, phones = pools
+    vehicles, zone_ids = np.asarray(vehicle_pool, dtype=object), np.asarray(zone_ids)
+    # Deterministic assignment: 90% get a vehicle from pool (no modulo randomness)
+    assigned = rng.random(n) < 0.9
+    current_vehicle_id = np.where(assigned, vehicles[rng.integers(0, len(vehicles), n)], None)
+    joined_at = as_of - pd.to_timedelta(rng.integers(0, 731, n), unit="D")  # Within the last 2 years
+    df = pd.DataFrame({
+        "driver_id": prefixed_ids("D", first_idx, n, 6),
+        "name": sample(names, rng, n),
+        "phone": sample_unique(phones, first_idx, n, seed),
+        "status": rng.choice(["active", "offline", "blocked"], size=n, p=[0.6, 0.3, 0.1]),
+        "rating": np.round(rng.uniform(3.5, 5.0, n), 2),
+        "lifetime_trips": rng.integers(0, 15001, n),
+        "current_vehicle_id": current_vehicle_id,  # Valid FK or None
+        "home_zone_id": zone_ids[rng.integers(0, len(zone_ids), n)],  # FK
+        "joined_at": joined_at.strftime("%Y-%m-%d"),
+        "version": 1,
+        "valid_from": "2023-01-01T00:00:00Z",
+        "valid_to": None
+    })
+    # Validation: FKs valid (ignore None for optional)
+    assigned_vehicles = df['current_vehicle_id'].dropna()
+    assert assigned_vehicles.isin(vehicle_pool).all(), "Driver vehicle FK invalid!"
+    assert df['home_zone_id'].isin(zone_ids).all(), "Driver zone FK invalid!"
+    return df
+
+def iter_driver_shards(n_drivers=10_000, vehicle_pool=None, zone_pool=None, seed=42, as_of=None,
+                       shard_size=SHARD_SIZE, shard_ids=None):
     if vehicle_pool is None:
         _, vehicle_pool = generate_vehicles()
     if zone_pool is None:
         _, zone_pool = generate_zones()
     zone_ids = [z['zone_id'] for z in zone_pool]
-    random.seed(seed)
-    statuses = ["active", "offline", "blocked"]
-    drivers = []
-    for i in range(n_drivers):
-        driver_id = f"D{str(i+1).zfill(6)}"
-        # Deterministic assignment: 90% get a vehicle from pool (no modulo randomness)
-        current_vehicle_id = random.choice(vehicle_pool) if random.random() < 0.9 else None
-        home_zone = random.choice(zone_ids)
-        joined_at = fake.date_between(start_date='-2y', end_date='today')
-        drivers.append({
-            "driver_id": driver_id,
-            "name": fake.name(),
-            "phone": fake.phone_number(),
-            "status": random.choices(statuses, weights=[0.6, 0.3, 0.1])[0],
-            "rating": round(random.uniform(3.5, 5.0), 2),
-            "lifetime_trips": random.randint(0, 15000),
-            "current_vehicle_id": current_vehicle_id,  # Valid FK or None
-            "home_zone_id": home_zone,  # FK
-            "joined_at": joined_at.isoformat(),
-            "version": 1,
-            "valid_from": "2023-01-01T00:00:00Z",
-            "valid_to": None
-        })
-    df = pd.DataFrame(drivers)
-    # Validation: FKs valid (ignore None for optional)
-    assigned_vehicles = df['current_vehicle_id'].dropna()
-    assert assigned_vehicles.isin(vehicle_pool).all(), "Driver vehicle FK invalid!"
-    assert df['home_zone_id'].isin(zone_ids).all(), "Driver zone FK invalid!"
-    assert df['driver_id'].nunique() == len(df), "Driver ID collision!"
+    # Fixed anchor keeps joined_at deterministic (default: today)
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.now().normalize()
+    pools = load_driver_pools(n_drivers, seed)
+    bounds = shard_bounds(n_drivers, shard_size)
+    seeds = shard_seeds(seed, len(bounds), "drivers")
+    for k in (range(len(bounds)) if shard_ids is None else shard_ids):
+        first_idx, n = bounds[k]
+        yield k, _driver_shard(first_idx, n, vehicle_pool, zone_ids, seeds[k], as_of, pools, seed)
+
+def check_assignment_rate(n_assigned, n_drivers):
     # Stat check: ~90% assigned
-    assert abs(df['current_vehicle_id'].notna().mean() - 0.9) < 0.05, "Assignment rate off!"
+    assert abs(n_assigned / n_drivers - 0.9) < 0.05, "Assignment rate off!"
+
+def generate_drivers(n_drivers=10_000, vehicle_pool=None, zone_pool=None, seed=42, as_of=None, shard_size=SHARD_SIZE):
+    df = pd.concat([shard for _, shard in iter_driver_shards(n_drivers, vehicle_pool, zone_pool, seed, as_of, shard_size)],
+                   ignore_index=True)
+    assert df['driver_id'].nunique() == len(df), "Driver ID collision!"
+    assert df['phone'].nunique() == len(df), "Driver phone collision!"
+    check_assignment_rate(df['current_vehicle_id'].notna().sum(), len(df))
     return df, list(df['driver_id'])  # Pool for trips
 
 if __name__ == "__main__":
     df, pool = generate_drivers()
     df.to_parquet("../../data_samples/drivers.parquet", compression="snappy")
-    print(f"Generated {len(df)} drivers with valid FKs → data_samples/")
\ No newline at end of file
+    print(f"Generated {len(df)} drivers with valid FKs → data_samples/")
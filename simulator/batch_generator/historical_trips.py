@@ -1,13 +1,17 @@
+import numpy as np
 import pandas as pd
-import random
-from faker import Faker
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from drivers import generate_drivers  # Chains pools
 from riders import generate_riders
 from zones import generate_zones
+from sharding import shard_bounds, shard_seeds, prefixed_ids, SHARD_SIZES
 
-fake = Faker()
+SHARD_SIZE = SHARD_SIZES["trips"]  # Also the chunk held in memory
 
-def generate_historical_trips(n_trips=1_000_000, driver_pool=None, rider_pool=None, zone_pool=None, months_back=24, seed=42):
+
+def _resolve_pools(driver_pool, rider_pool, zone_pool):
     if driver_pool is None:
         _, driver_pool = generate_drivers()
     if rider_pool is None:
@@ -15,46 +19,148 @@ def generate_historical_trips(n_trips=1_000_000, driver_pool=None, rider_pool=No
     if zone_pool is None:
         _, zone_pool = generate_zones()
     zone_ids = [z['zone_id'] for z in zone_pool]
-    random.seed(seed)
-    statuses = ["completed", "cancelled"]
-    trips = []
-    for i in range(n_trips):
-        trip_id = f"T{str(i+1).zfill(7)}"
-        start_time = fake.date_time_between(start_date=f'-{months_back}m', end_date='now')
-        duration_min = random.expovariate(1/15)  # Avg 15 min, exponential dist
-        # Triangular keeps most trips short, tail to ~30km, mean ≈14km
-        distance_km = random.triangular(1, 30, 12)
-        pickup_zone = random.choice(zone_ids)
-        dropoff_zone = random.choice(zone_ids)  # Allow same for short trips
-        driver_id = random.choice(driver_pool)
-        rider_id = random.choice(rider_pool)
-        surge_multiplier = 1.0 if random.random() < 0.8 else random.uniform(1.2, 3.0)
-        trips.append({
-            "trip_id": trip_id,
-            "driver_id": driver_id,  # FK
-            "rider_id": rider_id,  # FK
-            "pickup_zone_id": pickup_zone,  # FK
-            "dropoff_zone_id": dropoff_zone,  # FK
-            "start_time": start_time.isoformat(),
-            "duration_minutes": round(duration_min, 2),
-            "distance_km": round(distance_km, 2),
-            "status": random.choices(statuses, weights=[0.85, 0.15])[0],  # 15% cancel rate
-            "surge_multiplier": surge_multiplier,
-            "fare_usd": round((distance_km * 1.5 + duration_min * 0.5) * surge_multiplier, 2)
-        })
-    df = pd.DataFrame(trips)
-    # Validation: All FKs valid
-    assert df['driver_id'].isin(driver_pool).all(), "Trip driver FK invalid!"
-    assert df['rider_id'].isin(rider_pool).all(), "Trip rider FK invalid!"
-    assert df['pickup_zone_id'].isin(zone_ids).all(), "Trip pickup zone FK invalid!"
-    assert df['dropoff_zone_id'].isin(zone_ids).all(), "Trip dropoff zone FK invalid!"
-    assert df['trip_id'].nunique() == len(df), "Trip ID collision!"
-    # Stat check: Realistic aggregates
-    assert 8 < df['distance_km'].mean() < 20, "Avg distance unrealistic!"
-    assert 0.1 < df['status'].value_counts(normalize=True)['cancelled'] < 0.2, "Cancel rate off!"
-    return df
+    return driver_pool, rider_pool, zone_ids
+
+
+def _time_window(months_back, end_time):
+    # Fixed anchor keeps output deterministic for a seed (default: today at midnight)
+    end = pd.Timestamp(end_time) if end_time is not None else pd.Timestamp.now().normalize()
+    start = end - pd.DateOffset(months=months_back)
+    return start.to_datetime64().astype("datetime64[s]"), int((end - start).total_seconds())
+
+
+def _trip_chunk(rng, first_idx, n, drivers, riders, zones, window_start, window_s):
+    # Draw each column for the whole chunk at once
+    trip_ids = prefixed_ids("T", first_idx, n, 7)
+    start_time = window_start + rng.integers(0, window_s, n).astype("timedelta64[s]")
+    duration_min = rng.exponential(15, n)  # Avg 15 min, exponential dist
+    # Triangular keeps most trips short, tail to ~30km, mean ≈14km
+    distance_km = rng.triangular(1, 12, 30, n)
+    pickup_zone = zones[rng.integers(0, len(zones), n)]
+    dropoff_zone = zones[rng.integers(0, len(zones), n)]  # Allow same for short trips
+    driver_id = drivers[rng.integers(0, len(drivers), n)]
+    rider_id = riders[rng.integers(0, len(riders), n)]
+    surge = np.where(rng.random(n) < 0.8, 1.0, rng.uniform(1.2, 3.0, n))
+    status = np.where(rng.random(n) < 0.85, "completed", "cancelled")  # 15% cancel rate
+    fare = np.round((distance_km * 1.5 + duration_min * 0.5) * surge, 2)
+    return pa.table({
+        "trip_id": trip_ids,
+        "driver_id": driver_id,  # FK
+        "rider_id": rider_id,  # FK
+        "pickup_zone_id": pickup_zone,  # FK
+        "dropoff_zone_id": dropoff_zone,  # FK
+        "start_time": pa.array(start_time.astype("datetime64[ms]")),  # Real timestamp, not an ISO string
+        "duration_minutes": np.round(duration_min, 2),
+        "distance_km": np.round(distance_km, 2),
+        "status": status,
+        "surge_multiplier": surge,
+        "fare_usd": fare,
+    })
+
+
+class _TripChecks:
+    # Running validation: FKs per chunk, aggregate stats at the end
+    def __init__(self, driver_pool, rider_pool, zone_ids, first_idx=0):
+        self.fk_sets = {
+            "driver_id": pa.array(driver_pool),
+            "rider_id": pa.array(rider_pool),
+            "pickup_zone_id": pa.array(zone_ids),
+            "dropoff_zone_id": pa.array(zone_ids),
+        }
+        self.next_idx = first_idx
+        self.rows = 0
+        self.distance_sum = 0.0
+        self.cancelled = 0
+
+    def update(self, chunk, first_idx):
+        for col, value_set in self.fk_sets.items():
+            assert pc.all(pc.is_in(chunk[col], value_set=value_set)).as_py(), f"Trip {col} FK invalid!"
+        # IDs are a contiguous range, so chunks must arrive back to back
+        assert first_idx == self.next_idx, "Trip ID collision!"
+        self.next_idx += chunk.num_rows
+        self.rows += chunk.num_rows
+        self.distance_sum += pc.sum(chunk["distance_km"]).as_py()
+        self.cancelled += pc.sum(pc.equal(chunk["status"], "cancelled")).as_py()
+
+    def stats(self):
+        return self.rows, self.distance_sum, self.cancelled
+
+    def finish(self):
+        check_trip_stats([self.stats()])
+
+
+def check_trip_stats(shard_stats):
+    # Stat check: Realistic aggregates, merged across shards
+    rows, distance_sum, cancelled = (sum(col) for col in zip(*shard_stats))
+    assert 8 < distance_sum / rows < 20, "Avg distance unrealistic!"
+    assert 0.1 < cancelled / rows < 0.2, "Cancel rate off!"
+
+
+def n_trip_shards(n_trips, shard_size=SHARD_SIZE):
+    return len(shard_bounds(n_trips, shard_size))
+
+
+def iter_trip_chunks(n_trips=1_000_000, driver_pool=None, rider_pool=None, zone_pool=None, months_back=24,
+                     seed=42, end_time=None, shard_size=SHARD_SIZE, chunk_ids=None):
+    driver_pool, rider_pool, zone_ids = _resolve_pools(driver_pool, rider_pool, zone_pool)
+    yield from _iter_chunks(n_trips, driver_pool, rider_pool, zone_ids, months_back, seed, end_time, shard_size, chunk_ids)
+
+
+def _iter_chunks(n_trips, driver_pool, rider_pool, zone_ids, months_back, seed, end_time, shard_size, chunk_ids=None):
+    drivers, riders, zones = np.asarray(driver_pool), np.asarray(rider_pool), np.asarray(zone_ids)
+    window_start, window_s = _time_window(months_back, end_time)
+    bounds = shard_bounds(n_trips, shard_size)
+    # One independent stream per chunk: a chunk's rows depend only on (seed, chunk index)
+    seeds = shard_seeds(seed, len(bounds), "trips")
+    for k in (range(len(bounds)) if chunk_ids is None else chunk_ids):
+        first_idx, n = bounds[k]
+        rng = np.random.default_rng(seeds[k])
+        yield first_idx, _trip_chunk(rng, first_idx, n, drivers, riders, zones, window_start, window_s)
+
+
+def write_historical_trips(path, n_trips=1_000_000, driver_pool=None, rider_pool=None, zone_pool=None,
+                           months_back=24, seed=42, end_time=None, shard_size=SHARD_SIZE):
+    driver_pool, rider_pool, zone_ids = _resolve_pools(driver_pool, rider_pool, zone_pool)
+    checks = _TripChecks(driver_pool, rider_pool, zone_ids)
+    writer = None
+    try:
+        for first_idx, chunk in _iter_chunks(n_trips, driver_pool, rider_pool, zone_ids, months_back, seed, end_time, shard_size):
+            checks.update(chunk, first_idx)
+            if writer is None:
+                writer = pq.ParquetWriter(path, chunk.schema, compression="snappy")
+            writer.write_table(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    checks.finish()
+    return checks.rows
+
+
+def write_trip_shard(path, shard_id, n_trips, driver_pool, rider_pool, zone_ids, months_back=24, seed=42,
+                     end_time=None, shard_size=SHARD_SIZE):
+    # One chunk per shard → one part file; returns stats for the merged check
+    first_idx, _ = shard_bounds(n_trips, shard_size)[shard_id]
+    checks = _TripChecks(driver_pool, rider_pool, zone_ids, first_idx)
+    for first_idx, chunk in _iter_chunks(n_trips, driver_pool, rider_pool, zone_ids, months_back, seed, end_time,
+                                         shard_size, chunk_ids=[shard_id]):
+        checks.update(chunk, first_idx)
+        pq.write_table(chunk, path, compression="snappy")
+    return checks.stats()
+
+
+def generate_historical_trips(n_trips=1_000_000, driver_pool=None, rider_pool=None, zone_pool=None, months_back=24,
+                              seed=42, end_time=None, shard_size=SHARD_SIZE):
+    # In-memory variant for small runs; use write_historical_trips for large ones
+    driver_pool, rider_pool, zone_ids = _resolve_pools(driver_pool, rider_pool, zone_pool)
+    checks = _TripChecks(driver_pool, rider_pool, zone_ids)
+    chunks = []
+    for first_idx, chunk in _iter_chunks(n_trips, driver_pool, rider_pool, zone_ids, months_back, seed, end_time, shard_size):
+        checks.update(chunk, first_idx)
+        chunks.append(chunk)
+    checks.finish()
+    return pa.concat_tables(chunks).to_pandas()
+
 
 if __name__ == "__main__":
-    df = generate_historical_trips()
-    df.to_parquet("../../data_samples/historical_trips.parquet", compression="snappy")
-    print(f"Generated {len(df)} historical trips with valid FKs → data_samples/")
\ No newline at end of file
+    n = write_historical_trips("../../data_samples/historical_trips.parquet")
+    print(f"Generated {n} historical trips with valid FKs → data_samples/")
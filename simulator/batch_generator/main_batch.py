@@ -1,48 +1,203 @@
+import argparse
+import os
+import shutil
+import numpy as np
 import pandas as pd
-import random
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
 from zones import generate_zones
 from vehicles import generate_vehicles
-from riders import generate_riders
-from drivers import generate_drivers
-from historical_trips import generate_historical_trips
+from riders import generate_riders, iter_rider_shards, rider_ids, load_rider_pools, SHARD_SIZE as RIDER_SHARD_SIZE
+from drivers import (generate_drivers, iter_driver_shards, driver_ids, load_driver_pools, check_assignment_rate,
+                     SHARD_SIZE as DRIVER_SHARD_SIZE)
+from historical_trips import (write_historical_trips, write_trip_shard, n_trip_shards, check_trip_stats,
+                              SHARD_SIZE as TRIP_SHARD_SIZE)
+from sharding import shard_bounds, part_path, clear_output, reset_dataset, run_shards
+from trip_lake import build_trip_lake
+from scd2 import (build_dimension, merge_changelogs, read_dimension, read_state, source_fingerprint,
+                  file_fingerprint)
+from validate import validate
+from stage_metrics import StageTimer
 
-def main(output_date="20251209"):  # Current date format
+_POOLS = {}  # Per-process FK pools, set once by the pool initializer
+# joined_at anchor for the fleet. Fixed rather than the batch date, so a run for a later date
+# regenerates the same drivers the SCD2 dimension was loaded from
+FLEET_AS_OF = "20251209"
+
+def _init_worker(pools):
+    _POOLS.update(pools)
+
+def _run_task(task):
+    kind, shard_id, path, n_rows, anchor, shard_size = task
+    if kind == "riders":
+        (_, df), = iter_rider_shards(n_rows, zone_pool=_POOLS["zone_pool"], shard_size=shard_size,
+                                     shard_ids=[shard_id])
+        df.to_parquet(path, compression="snappy")
+        return len(df)
+    if kind == "drivers":
+        (_, df), = iter_driver_shards(n_rows, _POOLS["vehicle_pool"], _POOLS["zone_pool"], as_of=anchor,
+                                      shard_size=shard_size, shard_ids=[shard_id])
+        df.to_parquet(path, compression="snappy")
+        return df['current_vehicle_id'].notna().sum()
+    zone_ids = [z['zone_id'] for z in _POOLS["zone_pool"]]
+    return write_trip_shard(path, shard_id, n_rows, _POOLS["driver_pool"], _POOLS["rider_pool"], zone_ids,
+                            end_time=anchor, shard_size=shard_size)
+
+def generate_sharded(output_dir, zone_pool, vehicle_pool, output_date, n_riders=100_000, n_drivers=10_000,
+                     n_trips=1_000_000, workers=None, trip_shard_size=TRIP_SHARD_SIZE):
+    # Riders, drivers and trips only share ID pools, which are known up front,
+    # so every shard of every entity goes into one process pool.
+    rider_dir = reset_dataset(output_dir / "riders.parquet")
+    driver_dir = reset_dataset(output_dir / "drivers.parquet")
+    trip_dir = reset_dataset(output_dir / "historical_trips.parquet")
+    tasks = (
+        [("riders", k, part_path(rider_dir, k), n_riders, None, RIDER_SHARD_SIZE)
+         for k in range(len(shard_bounds(n_riders, RIDER_SHARD_SIZE)))]
+        + [("drivers", k, part_path(driver_dir, k), n_drivers, FLEET_AS_OF, DRIVER_SHARD_SIZE)
+           for k in range(len(shard_bounds(n_drivers, DRIVER_SHARD_SIZE)))]
+        + [("trips", k, part_path(trip_dir, k), n_trips, output_date, trip_shard_size)
+           for k in range(n_trip_shards(n_trips, trip_shard_size))]
+    )
+    # Fill the Faker attribute pools once here; workers then read them from the disk cache
+    load_rider_pools(n_riders)
+    load_driver_pools(n_drivers)
+    pools = {
+        "zone_pool": zone_pool,
+        "vehicle_pool": vehicle_pool,
+        "rider_pool": rider_ids(n_riders),
+        "driver_pool": driver_ids(n_drivers),
+    }
+    results = run_shards(_run_task, tasks, workers or os.cpu_count(), _init_worker, (pools,))
+    by_kind = {}
+    for task, result in zip(tasks, results):
+        by_kind.setdefault(task[0], []).append(result)
+    check_assignment_rate(sum(by_kind["drivers"]), n_drivers)
+    check_trip_stats(by_kind["trips"])
+    return pools["driver_pool"], n_trips
+
+def write_changelog(current_df, vehicle_pool, changelog_path, output_date, source, seed=42):
+    # Simulate Changelog (e.g., batch update: reassign 5% vehicles). Drawn from the dimension's
+    # open versions, so each day's versions follow the previous day's; seeded per date.
+    # source (the dimension's source fingerprint) is kept in the file metadata
+    rng = np.random.default_rng((seed, int(output_date)))
+    changelog = current_df.sample(frac=0.05, random_state=rng).copy()
+    changelog['current_vehicle_id'] = np.asarray(vehicle_pool)[rng.integers(0, len(vehicle_pool), len(changelog))]
+    changelog['version'] += 1
+    changelog['valid_from'] = pd.Timestamp(output_date).isoformat()  # Effective date of the batch
+    table = pa.Table.from_pandas(changelog, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b"scd2_source": source.encode()})
+    pq.write_table(table, changelog_path, compression="snappy")
+    return changelog_path
+
+def reusable_changelog(changelog_path, dim_dir):
+    # An existing changelog is only merged if it is the one this dimension already merged, or was
+    # drawn from it: same source, and every row exactly one version past its driver's open version
+    if not changelog_path.exists():
+        return False
+    state = read_state(dim_dir)
+    if state.get("batches", {}).get(changelog_path.stem) == file_fingerprint(changelog_path):
+        return True
+    metadata = pq.read_schema(changelog_path).metadata or {}
+    if metadata.get(b"scd2_source", b"").decode() != state.get("source"):
+        return False
+    changes = pq.read_table(changelog_path, columns=["driver_id", "version"]).to_pandas()
+    open_versions = read_dimension(dim_dir, current_only=True).select(["driver_id", "version"]).to_pandas()
+    open_versions = open_versions.set_index("driver_id")["version"]
+    return bool((changes["version"] == changes["driver_id"].map(open_versions) + 1).all())
+
+def main(output_date="20251209", parallel=False, workers=None, rebuild_dimension=False,
+         trip_shard_size=TRIP_SHARD_SIZE):  # Current date format
     print("Generating consistent batch data...")
     output_dir = Path(__file__).resolve().parent / ".." / ".." / "data_samples"
     output_dir.mkdir(parents=True, exist_ok=True)
+    timer = StageTimer()
     
     # Step 1: Static
-    zones_df, zone_pool = generate_zones()
-    vehicles_df, vehicle_pool = generate_vehicles()
-    zones_df.to_parquet(output_dir / "zones.parquet", compression="snappy")
-    vehicles_df.to_parquet(output_dir / "vehicles.parquet", compression="snappy")
-    
-    # Step 2: Entities with FKs
-    riders_df, rider_pool = generate_riders(zone_pool=zone_pool)
-    drivers_df, driver_pool = generate_drivers(vehicle_pool=vehicle_pool, zone_pool=zone_pool)
-    riders_df.to_parquet(output_dir / "riders.parquet", compression="snappy")
-    drivers_df.to_parquet(output_dir / "drivers.parquet", compression="snappy")
+    with timer.stage("static"):
+        zones_df, zone_pool = generate_zones()
+        vehicles_df, vehicle_pool = generate_vehicles()
+        zones_df.to_parquet(output_dir / "zones.parquet", compression="snappy")
+        vehicles_df.to_parquet(output_dir / "vehicles.parquet", compression="snappy")
     
-    # Step 3: Historical
-    trips_df = generate_historical_trips(driver_pool=driver_pool, rider_pool=rider_pool, zone_pool=zone_pool)
-    trips_df.to_parquet(output_dir / "historical_trips.parquet", compression="snappy")
-    
-    # Simulate Changelog (e.g., batch update: reassign 5% vehicles)
-    changelog = drivers_df.sample(frac=0.05).copy()
-    changelog['current_vehicle_id'] = [random.choice(vehicle_pool) for _ in changelog.index]
-    changelog['version'] += 1
-    changelog['valid_from'] = pd.Timestamp.now().isoformat()
-    changelog_path = output_dir / f"drivers_changelog_{output_date}.parquet"
-    changelog.to_parquet(changelog_path, compression="snappy")
+    if parallel:
+        # Steps 2+3 sharded: part files under riders/drivers/historical_trips.parquet/
+        with timer.stage("entities_and_trips"):
+            driver_pool, n_trips = generate_sharded(output_dir, zone_pool, vehicle_pool, output_date, workers=workers,
+                                                    trip_shard_size=trip_shard_size)
+            drivers_df = pd.read_parquet(output_dir / "drivers.parquet")
+    else:
+        # Step 2: Entities with FKs
+        with timer.stage("entities"):
+            riders_df, rider_pool = generate_riders(zone_pool=zone_pool)
+            drivers_df, driver_pool = generate_drivers(vehicle_pool=vehicle_pool, zone_pool=zone_pool,
+                                                       as_of=FLEET_AS_OF)
+            riders_df.to_parquet(clear_output(output_dir / "riders.parquet"), compression="snappy")
+            drivers_df.to_parquet(clear_output(output_dir / "drivers.parquet"), compression="snappy")
+
+        # Step 3: Historical
+        # Streamed in chunks; anchored on output_date so reruns are reproducible
+        with timer.stage("trips"):
+            n_trips = write_historical_trips(clear_output(output_dir / "historical_trips.parquet"),
+                                             driver_pool=driver_pool, rider_pool=rider_pool, zone_pool=zone_pool,
+                                             end_time=output_date, shard_size=trip_shard_size)
+
+    # Step 4: Lake layout: year/month partitions clustered on pickup_zone_id; the flat output was staging
+    with timer.stage("trip_lake"):
+        raw_trips = output_dir / "historical_trips.parquet"
+        build_trip_lake(raw_trips, output_dir / "historical_trips")
+        if raw_trips.is_dir():
+            shutil.rmtree(raw_trips)
+        else:
+            raw_trips.unlink()
+
+    # Step 5: SCD2 drivers dimension, kept across runs: loaded from drivers once, then each day's changelog
+    # is merged into it. It is rebuilt (dropping its history) when drivers.parquet no longer matches its source.
+    dim_dir = output_dir / "drivers_dim"
+    with timer.stage("changelog"):
+        state = read_state(dim_dir)
+        if rebuild_dimension or state.get("source") != source_fingerprint(output_dir / "drivers.parquet"):
+            if state and not rebuild_dimension:
+                print("drivers.parquet changed since drivers_dim was built; rebuilding it, history dropped.")
+            build_dimension(output_dir / "drivers.parquet", dim_dir)
+        # A date's changelog is reused if it belongs to this dimension (a rerun then merges as a no-op);
+        # anything else, e.g. one left from another dimension, is drawn again
+        changelog_path = output_dir / f"drivers_changelog_{output_date}.parquet"
+        if not reusable_changelog(changelog_path, dim_dir):
+            if changelog_path.exists():
+                print(f"{changelog_path.name} was not drawn from drivers_dim; regenerating it.")
+            write_changelog(read_dimension(dim_dir, current_only=True).to_pandas(), vehicle_pool, changelog_path,
+                            output_date, read_state(dim_dir)["source"])
+
+    with timer.stage("scd2"):
+        for stats in merge_changelogs(dim_dir, [changelog_path]):
+            print(f"SCD2 merge {stats['batch']}: {stats['closed']} versions closed, {stats['opened']} opened, "
+                  f"{stats['files_written']} files written{' (compacted)' if stats['compacted'] else ''}.")
+
+    # Step 6: Data quality over everything written; reports every failed check, not just the first
+    with timer.stage("validate"):
+        report = validate(output_dir)
+    print(report.format())
+    timer.write(output_dir / "batch_metrics.prom")  # Written even when validation fails
+    assert report.ok, f"Data quality validation failed: {len(report.failures)} checks"
     
     # Global Validation: Cross-entity stats
     assigned_drivers = drivers_df['current_vehicle_id'].notna().sum()
     print(f"Success: {assigned_drivers}/{len(drivers_df)} drivers assigned vehicles.")
-    trips_per_driver = len(trips_df) / len(driver_pool)
+    trips_per_driver = n_trips / len(driver_pool)
     print(f"Realistic load: ~{trips_per_driver:.1f} historical trips/driver over {24} months.")
     
     print("Batch generation complete! Files in data_samples/")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output-date", default="20251209")
+    parser.add_argument("--parallel", action="store_true", help="Sharded generation on a process pool")
+    parser.add_argument("--workers", type=int, default=None, help="Defaults to the CPU count")
+    parser.add_argument("--rebuild-dimension", action="store_true",
+                        help="Reload drivers_dim from drivers.parquet, dropping its history")
+    parser.add_argument("--trip-shard-size", type=int, default=TRIP_SHARD_SIZE,
+                        help="Trips per shard; output depends on it, not on --parallel or --workers")
+    args = parser.parse_args()
+    main(args.output_date, parallel=args.parallel, workers=args.workers, rebuild_dimension=args.rebuild_dimension,
+         trip_shard_size=args.trip_shard_size)
\ No newline at end of file
@@ -1,36 +1,54 @@
+import numpy as np
 import pandas as pd
-import random
-from faker import Faker
 from zones import generate_zones  # Import for zone pool
+from sharding import shard_bounds, shard_seeds, prefixed_ids, SHARD_SIZES
+from attribute_pools import load_pool, sample, sample_unique, NAME_POOL_SIZE
 
-fake = Faker()
+SHARD_SIZE = SHARD_SIZES["riders"]
 
-def generate_riders(n_riders=100_000, seed=42, zone_pool=None):
-    random.seed(seed)
-    if zone_pool is None:
-        _, zone_pool = generate_zones()  # Get zone IDs
-    zone_ids = [z['zone_id'] for z in zone_pool]  # Wait, fix: actually load or pass
-    # Temp: assume zones generated first
-    riders = []
-    for i in range(n_riders):
-        rider_id = f"R{str(i+1).zfill(6)}"
-        home_zone = random.choice(zone_ids)
-        riders.append({
-            "rider_id": rider_id,
-            "name": fake.name(),
-            "phone": fake.phone_number(),
-            "rating": round(random.uniform(4.0, 5.0), 2),  # Beta dist for realism
-            "lifetime_trips": random.choices([0, 5, 20, 100, 500], weights=[0.1, 0.2, 0.3, 0.3, 0.1])[0],
-            "preferred_payment": random.choice(["card", "cash", "wallet"]),
-            "home_zone_id": home_zone  # FK to zones
-        })
-    df = pd.DataFrame(riders)
+def rider_ids(n_riders):
+    return list(prefixed_ids("R", 0, n_riders, 6))
+
+def load_rider_pools(n_riders, seed=42):
+    # Phones must be unique per rider: a fixed pool of area-code prefixes, each row mapped
+    # to its own prefix + serial by sample_unique
+    return load_pool("name", NAME_POOL_SIZE, seed), load_pool("phone", n_riders, seed, unique=True)
+
+def _rider_shard(first_idx, n, zone_ids, seed_seq, pools, seed):
+    rng = np.random.default_rng(seed_seq)
+    names, phones = pools
+    zone_ids = np.asarray(zone_ids)
+    df = pd.DataFrame({
+        "rider_id": prefixed_ids("R", first_idx, n, 6),
+        "name": sample(names, rng, n),
+        "phone": sample_unique(phones, first_idx, n, seed),
+        "rating": np.round(rng.uniform(4.0, 5.0, n), 2),  # Beta dist for realism
+        "lifetime_trips": rng.choice([0, 5, 20, 100, 500], size=n, p=[0.1, 0.2, 0.3, 0.3, 0.1]),
+        "preferred_payment": rng.choice(["card", "cash", "wallet"], size=n),
+        "home_zone_id": zone_ids[rng.integers(0, len(zone_ids), n)]  # FK to zones
+    })
     # Validation: All home_zone_id exist
     assert df['home_zone_id'].isin(zone_ids).all(), "Rider zone FK invalid!"
+    return df
+
+def iter_rider_shards(n_riders=100_000, seed=42, zone_pool=None, shard_size=SHARD_SIZE, shard_ids=None):
+    if zone_pool is None:
+        _, zone_pool = generate_zones()  # Get zone IDs
+    zone_ids = [z['zone_id'] for z in zone_pool]
+    pools = load_rider_pools(n_riders, seed)
+    bounds = shard_bounds(n_riders, shard_size)
+    seeds = shard_seeds(seed, len(bounds), "riders")
+    for k in (range(len(bounds)) if shard_ids is None else shard_ids):
+        first_idx, n = bounds[k]
+        yield k, _rider_shard(first_idx, n, zone_ids, seeds[k], pools, seed)
+
+def generate_riders(n_riders=100_000, seed=42, zone_pool=None, shard_size=SHARD_SIZE):
+    df = pd.concat([shard for _, shard in iter_rider_shards(n_riders, seed, zone_pool, shard_size)], ignore_index=True)
     assert df['rider_id'].nunique() == len(df), "Rider ID collision!"
+    assert df['phone'].nunique() == len(df), "Rider phone collision!"
     return df, list(df['rider_id'])  # Pool for trips
 
 if __name__ == "__main__":
     df, pool = generate_riders()
     df.to_parquet("../../data_samples/riders.parquet", compression="snappy")
-    print(f"Generated {len(df)} riders → data_samples/")
\ No newline at end of file
+    print(f"Generated {len(df)} riders → data_samples/")
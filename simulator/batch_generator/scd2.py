@@ -0,0 +1,222 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import zlib
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Drivers dimension as SCD Type 2, merge-on-read:
+#   <dim>/current/bucket-NNN.parquet    open rows (valid_to null) as of the last compaction, hashed on driver_id
+#   <dim>/current/delta-<batch>.parquet open rows a merge added; they shadow older versions in the buckets
+#   <dim>/history/<batch>.parquet       versions a merge closed, append-only
+#   <dim>/state.json                    source fingerprint and the changelogs merged so far
+# A daily changelog hits drivers all over the key space, so any bucketing would have it touch
+# nearly every bucket. A merge instead writes one delta and one history file and rewrites
+# nothing; the buckets are only rewritten once the deltas reach COMPACT_FRACTION of them.
+N_BUCKETS = 32
+COMPACT_FRACTION = 0.2  # ~every 4-5 daily batches at the 5% changelog rate
+KEY = "driver_id"
+DIM_SCHEMA = pa.schema([
+    ("driver_id", pa.string()),
+    ("name", pa.string()),
+    ("phone", pa.string()),
+    ("status", pa.string()),
+    ("rating", pa.float64()),
+    ("lifetime_trips", pa.int64()),
+    ("current_vehicle_id", pa.string()),
+    ("home_zone_id", pa.string()),
+    ("joined_at", pa.string()),
+    ("version", pa.int64()),
+    ("valid_from", pa.string()),
+    ("valid_to", pa.string()),
+])
+
+
+def _read(path):
+    # Drops the pandas index column and pins types (valid_to is all-null, so untyped, in the source)
+    return ds.dataset(path, format="parquet").to_table(columns=DIM_SCHEMA.names).cast(DIM_SCHEMA)
+
+
+def _write(table, path):
+    # Write-then-rename so a crash never leaves a half-written file behind
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(table, tmp, compression="snappy")
+    os.replace(tmp, path)
+
+
+def bucket_of(driver_ids, n_buckets=N_BUCKETS):
+    # crc32 rather than hash(): stable across processes and runs
+    ids = driver_ids.to_pylist()
+    return np.fromiter((zlib.crc32(i.encode()) for i in ids), dtype=np.uint32, count=len(ids)) % n_buckets
+
+
+def _bucket_path(dim_dir, bucket):
+    return dim_dir / "current" / f"bucket-{bucket:03d}.parquet"
+
+
+def _write_buckets(table, dim_dir, n_buckets):
+    buckets = bucket_of(table.column(KEY), n_buckets)
+    for b in range(n_buckets):
+        _write(table.filter(pa.array(buckets == b)).sort_by(KEY), _bucket_path(dim_dir, b))
+
+
+def table_fingerprint(table):
+    # Content hash, independent of file layout and row order
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table.sort_by(KEY))
+    return hashlib.sha256(sink.getvalue()).hexdigest()
+
+
+def file_fingerprint(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def read_state(dim_dir):
+    # {"source": fingerprint of the drivers table it was built from, "batches": {changelog stem: file hash}}
+    path = Path(dim_dir) / "state.json"
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _write_state(dim_dir, state):
+    path = Path(dim_dir) / "state.json"
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def source_fingerprint(drivers_path):
+    return table_fingerprint(_read(drivers_path))
+
+
+def build_dimension(drivers_path, dim_dir, n_buckets=N_BUCKETS):
+    # Initial load: every driver's row is its open version
+    dim_dir = Path(dim_dir)
+    if dim_dir.exists():
+        shutil.rmtree(dim_dir)
+    (dim_dir / "current").mkdir(parents=True)
+    (dim_dir / "history").mkdir()
+    table = _read(drivers_path)
+    _write_buckets(table, dim_dir, n_buckets)
+    _write_state(dim_dir, {"source": table_fingerprint(table), "batches": {}})
+    return table.num_rows
+
+
+def _latest(table):
+    # One row per driver, its highest version: what a delta shadows is dropped
+    table = table.sort_by([(KEY, "ascending"), ("version", "descending")]).combine_chunks()
+    ids = table.column(KEY).chunk(0) if table.num_rows else pa.array([], pa.string())
+    first = np.ones(len(ids), dtype=bool)
+    first[1:] = pc.not_equal(ids.slice(1), ids.slice(0, len(ids) - 1)).to_numpy(zero_copy_only=False)
+    return table.filter(pa.array(first))
+
+
+def _open_rows(dim_dir, filter=None):
+    files = [str(f) for f in sorted((Path(dim_dir) / "current").glob("*.parquet"))]
+    return _latest(ds.dataset(files, schema=DIM_SCHEMA, format="parquet").to_table(filter=filter))
+
+
+def _apply(current, changes):
+    # current: the open rows of the changelog's drivers. Hash join on driver_id drops
+    # changes at or below the open version, which is what makes re-running a changelog a no-op.
+    # Returns (rows that become open, rows closed, number of fresh changes).
+    open_versions = current.select([KEY, "version"]).rename_columns([KEY, "open_version"])
+    joined = changes.join(open_versions, KEY, join_type="left outer")
+    newer = pc.fill_null(pc.greater(joined.column("version"), joined.column("open_version")), True)
+    fresh = joined.filter(newer).select(DIM_SCHEMA.names)
+    if fresh.num_rows == 0:
+        return None, None, 0
+    # Sorted merge on (driver_id, version): a row followed by a later version of the
+    # same driver is closed with that version's valid_from
+    current = current.append_column("_fresh", pa.repeat(False, current.num_rows))
+    fresh = fresh.append_column("_fresh", pa.repeat(True, fresh.num_rows))
+    merged = pa.concat_tables([current, fresh]).sort_by([(KEY, "ascending"), ("version", "ascending")])
+    merged = merged.combine_chunks()
+    ids = merged.column(KEY).chunk(0)
+    superseded = np.zeros(merged.num_rows, dtype=bool)
+    superseded[:-1] = pc.equal(ids.slice(0, len(ids) - 1), ids.slice(1)).to_numpy(zero_copy_only=False)
+    superseded = pa.array(superseded)
+    valid_from = merged.column("valid_from").chunk(0)
+    next_from = pa.concat_arrays([valid_from.slice(1), pa.nulls(1, pa.string())])
+    valid_to = pc.if_else(superseded, next_from, merged.column("valid_to").chunk(0))
+    merged = merged.set_column(DIM_SCHEMA.get_field_index("valid_to"), DIM_SCHEMA.field("valid_to"), valid_to)
+    opened = merged.filter(pc.and_(pc.invert(superseded), merged.column("_fresh")))
+    return opened.drop_columns(["_fresh"]), merged.filter(superseded).drop_columns(["_fresh"]), fresh.num_rows
+
+
+def compact(dim_dir, n_buckets=None):
+    # Fold the deltas back into the buckets. Buckets are swapped before the deltas are
+    # deleted: a crash in between leaves rows duplicated, never lost, and _latest dedupes them.
+    current = Path(dim_dir) / "current"
+    n_buckets = n_buckets or len(list(current.glob("bucket-*.parquet")))
+    deltas = sorted(current.glob("delta-*.parquet"))
+    _write_buckets(_open_rows(dim_dir), Path(dim_dir), n_buckets)
+    for path in deltas:
+        path.unlink()
+    return len(deltas)
+
+
+def merge_changelog(dim_dir, changelog_path, compact_fraction=COMPACT_FRACTION):
+    dim_dir = Path(dim_dir)
+    current = dim_dir / "current"
+    buckets = sorted(current.glob("bucket-*.parquet"))
+    if not buckets:
+        raise FileNotFoundError(f"No drivers dimension at {dim_dir}; run build_dimension first")
+    batch = Path(changelog_path).stem
+    changes = _read(changelog_path)
+    stats = {"batch": batch, "files_written": 0, "opened": 0, "closed": 0, "compacted": False}
+    # Only the open rows of the drivers this changelog touches are read
+    touched = _open_rows(dim_dir, pc.field(KEY).isin(pc.unique(changes.column(KEY))))
+    opened, closed, n_fresh = _apply(touched, changes)
+    if opened is not None:
+        # History before the delta: a crash in between just rewrites the same file on re-run
+        if closed.num_rows:
+            _write(closed, dim_dir / "history" / f"{batch}.parquet")
+            stats["files_written"] += 1
+        _write(opened, current / f"delta-{batch}.parquet")
+        stats["files_written"] += 1
+        stats["opened"], stats["closed"] = n_fresh, closed.num_rows
+        base_rows = sum(pq.ParquetFile(p).metadata.num_rows for p in buckets)
+        delta_rows = sum(pq.ParquetFile(p).metadata.num_rows for p in current.glob("delta-*.parquet"))
+        if delta_rows > compact_fraction * base_rows:
+            compact(dim_dir, len(buckets))
+            stats["compacted"] = True
+            stats["files_written"] += len(buckets)
+    # Recorded last, so a crashed merge is simply re-run
+    state = read_state(dim_dir)
+    state.setdefault("batches", {})[batch] = file_fingerprint(changelog_path)
+    _write_state(dim_dir, state)
+    return stats
+
+
+def merge_changelogs(dim_dir, changelog_paths):
+    # Applied in file name (i.e. batch date) order
+    return [merge_changelog(dim_dir, path) for path in sorted(changelog_paths, key=lambda p: Path(p).name)]
+
+
+def read_dimension(dim_dir, current_only=False):
+    # Open versions (deltas applied), plus every closed version unless current_only
+    dim_dir = Path(dim_dir)
+    current = _open_rows(dim_dir)
+    if current_only:
+        return current
+    history = [str(f) for f in sorted((dim_dir / "history").glob("*.parquet"))]
+    return pa.concat_tables([current, ds.dataset(history, schema=DIM_SCHEMA, format="parquet").to_table()])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply drivers changelogs to the SCD2 drivers dimension")
+    parser.add_argument("dim_dir")
+    parser.add_argument("changelogs", nargs="*")
+    parser.add_argument("--init", metavar="DRIVERS", help="(Re)build the dimension from a drivers table first")
+    args = parser.parse_args()
+    if args.init:
+        print(f"Loaded {build_dimension(args.init, args.dim_dir)} drivers into {args.dim_dir}")
+    for stats in merge_changelogs(args.dim_dir, args.changelogs):
+        print(stats)
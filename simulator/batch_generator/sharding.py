@@ -0,0 +1,49 @@
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+
+# Shard layout depends only on row count and shard size, never on worker count,
+# so a dataset is identical however many processes generate it. One size per
+# entity, so every module that reads or writes its shards agrees on the layout.
+SHARD_SIZES = {"riders": 10_000, "drivers": 2_000, "trips": 100_000}
+
+def shard_bounds(n_rows, shard_size):
+    return [(start, min(shard_size, n_rows - start)) for start in range(0, n_rows, shard_size)]
+
+def shard_seeds(seed, n_shards, entity):
+    # Independent child stream per shard, under a root per entity: shard k of riders
+    # and shard k of trips must not replay the same draws
+    return np.random.SeedSequence([seed, zlib.crc32(entity.encode())]).spawn(n_shards)
+
+def prefixed_ids(prefix, first_idx, n, width):
+    # Vectorized f"{prefix}{i+1:0{width}d}" for a contiguous block of rows
+    return np.char.add(prefix, np.char.zfill(np.arange(first_idx + 1, first_idx + n + 1).astype(str), width))
+
+def part_path(dataset_dir, shard_id):
+    return Path(dataset_dir) / f"part-{shard_id:05d}.parquet"
+
+def clear_output(path):
+    # Serial runs write a file and parallel runs a part-file dir under the same name; drop either
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+    return path
+
+def reset_dataset(path):
+    # A dataset dir replaces any earlier single-file output of the same name
+    path = clear_output(path)
+    path.mkdir(parents=True)
+    return path
+
+def run_shards(fn, tasks, workers=1, initializer=None, initargs=()):
+    # Results come back in task order regardless of completion order
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [fn(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        return list(pool.map(fn, tasks))
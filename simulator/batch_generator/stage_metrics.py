@@ -0,0 +1,36 @@
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class StageTimer:
+    # Wall time per main_batch stage. The batch run has no server to scrape, so the
+    # timings go to a Prometheus textfile (node_exporter's textfile collector format).
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = time.perf_counter() - t0
+            print(f"[{name}] {self.seconds[name]:.2f}s")
+
+    def render(self):
+        lines = ["# HELP batch_stage_seconds Wall time of each main_batch stage in the last run",
+                 "# TYPE batch_stage_seconds gauge"]
+        lines += [f'batch_stage_seconds{{stage="{name}"}} {s:.6f}' for name, s in self.seconds.items()]
+        lines += ["# HELP batch_last_run_timestamp_seconds When the last main_batch run finished",
+                  "# TYPE batch_last_run_timestamp_seconds gauge",
+                  f"batch_last_run_timestamp_seconds {time.time():.3f}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # Atomic, so a collector never reads a half-written file
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.render())
+        os.replace(tmp, path)
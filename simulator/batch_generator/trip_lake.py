@@ -0,0 +1,81 @@
+import shutil
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Hive layout: <lake>/year=YYYY/month=M/part-0.parquet, rows sorted by pickup_zone_id
+# so row-group min/max stats prune zone filters as well as the partitions prune time.
+PARTITIONING = ds.partitioning(pa.schema([("year", pa.int16()), ("month", pa.int8())]), flavor="hive")
+ROW_GROUP_SIZE = 256_000
+SORT_KEYS = [("pickup_zone_id", "ascending"), ("start_time", "ascending")]
+
+
+def _with_partition_columns(batches):
+    for batch in batches:
+        start = batch.column("start_time")
+        yield batch.append_column("year", pc.year(start).cast(pa.int16())).append_column(
+            "month", pc.month(start).cast(pa.int8()))
+
+
+def build_trip_lake(source, lake_dir, row_group_size=ROW_GROUP_SIZE):
+    # Two passes, memory bounded by one month: stream the flat trips into a
+    # month-partitioned staging area, then sort and rewrite each month once.
+    lake_dir = Path(lake_dir)
+    staging = lake_dir.with_name(f".{lake_dir.name}_staging")
+    for path in (staging, lake_dir):
+        if path.exists():
+            shutil.rmtree(path)
+    source = ds.dataset(source, format="parquet")
+    schema = source.schema.append(pa.field("year", pa.int16())).append(pa.field("month", pa.int8()))
+    ds.write_dataset(_with_partition_columns(source.to_batches()), staging, schema=schema, format="parquet",
+                     partitioning=PARTITIONING)
+    n_rows = 0
+    for month_dir in sorted(staging.glob("year=*/month=*")):
+        table = ds.dataset(month_dir, format="parquet").to_table().sort_by(SORT_KEYS)
+        out = lake_dir / month_dir.relative_to(staging)
+        out.mkdir(parents=True)
+        pq.write_table(table, out / "part-0.parquet", row_group_size=row_group_size, compression="snappy")
+        n_rows += table.num_rows
+    shutil.rmtree(staging)
+    return n_rows
+
+
+def trip_dataset(lake_dir):
+    return ds.dataset(lake_dir, format="parquet", partitioning=PARTITIONING)
+
+
+def trip_filter(start=None, end=None, zones=None):
+    # (year, month) bounds from each side prune whole directories, so a start- or
+    # end-only range skips partitions too; start_time and pickup_zone_id predicates
+    # prune row groups by their stats
+    expr = None
+    year, month = pc.field("year"), pc.field("month")
+    if start is not None:
+        start = pd.Timestamp(start)
+        expr = _and(expr, (year > start.year) | ((year == start.year) & (month >= start.month)))
+        expr = _and(expr, pc.field("start_time") >= pa.scalar(start.to_pydatetime(), pa.timestamp("ms")))
+    if end is not None:
+        end = pd.Timestamp(end)
+        last = end - pd.Timedelta(microseconds=1)  # end is exclusive
+        expr = _and(expr, (year < last.year) | ((year == last.year) & (month <= last.month)))
+        expr = _and(expr, pc.field("start_time") < pa.scalar(end.to_pydatetime(), pa.timestamp("ms")))
+    if zones is not None:
+        expr = _and(expr, pc.field("pickup_zone_id").isin(list(zones)))
+    return expr
+
+
+def _and(a, b):
+    return b if a is None else a & b
+
+
+def scan_trips(lake_dir, start=None, end=None, zones=None, columns=None, batch_size=131_072):
+    # Record batches matching the filter, never materializing the dataset
+    return trip_dataset(lake_dir).to_batches(columns=columns, filter=trip_filter(start, end, zones),
+                                             batch_size=batch_size)
+
+
+def read_trips(lake_dir, start=None, end=None, zones=None, columns=None):
+    return trip_dataset(lake_dir).to_table(columns=columns, filter=trip_filter(start, end, zones))
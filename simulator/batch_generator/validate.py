@@ -0,0 +1,378 @@
+import argparse
+import json
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from scd2 import read_dimension
+
+DATA_DIR = Path(__file__).resolve().parent / ".." / ".." / "data_samples"
+BATCH_SIZE = 262_144  # Rows per scanned record batch
+BUCKET_ROWS = 4_000_000  # Keys per uniqueness bucket held in memory at once
+MAX_EXAMPLES = 5
+
+# Checked in this order, so FK parents are scanned (and their keys kept) before children.
+#   unique: key columns (a tuple is a composite key), across the dataset or with unique_per_file within
+#   each file; fks: column → parent dataset (by its first unique key);
+#   ranges: every non-null value within [lo, hi]; values: allowed categories;
+#   means/shares: dataset-level mean / fraction of rows matching a predicate within (lo, hi)
+DATASETS = {
+    "zones": {
+        "path": "zones.parquet",
+        "unique": ["zone_id"],
+        "ranges": {"density": (0.5, 2.0)},
+    },
+    "vehicles": {
+        "path": "vehicles.parquet",
+        "unique": ["vehicle_id", "license_plate"],
+        "values": {"status": ["active", "maintenance"], "type": ["sedan", "suv", "hatchback", "electric"]},
+    },
+    "riders": {
+        "path": "riders.parquet",
+        "unique": ["rider_id", "phone"],
+        "fks": {"home_zone_id": "zones"},
+        "ranges": {"rating": (4.0, 5.0)},
+        "values": {"preferred_payment": ["card", "cash", "wallet"]},
+    },
+    "drivers": {
+        "path": "drivers.parquet",
+        "unique": ["driver_id", "phone"],
+        "fks": {"home_zone_id": "zones", "current_vehicle_id": "vehicles"},
+        "ranges": {"rating": (3.5, 5.0), "lifetime_trips": (0, 15_000)},
+        "values": {"status": ["active", "offline", "blocked"]},
+        "shares": {"assigned a vehicle": (lambda b: pc.is_valid(b["current_vehicle_id"]), 0.85, 0.95)},
+    },
+    "historical_trips": {
+        "path": ["historical_trips", "historical_trips.parquet"],  # Partitioned lake, else the flat file
+        "unique": ["trip_id"],
+        "fks": {"driver_id": "drivers", "rider_id": "riders", "pickup_zone_id": "zones", "dropoff_zone_id": "zones"},
+        "ranges": {"duration_minutes": (0, None), "distance_km": (1, 30), "surge_multiplier": (1, 3),
+                   "fare_usd": (0, None)},
+        "values": {"status": ["completed", "cancelled"]},
+        "means": {"distance_km": (8, 20)},
+        "shares": {"cancelled": (lambda b: pc.equal(b["status"], "cancelled"), 0.1, 0.2)},
+    },
+    "drivers_changelog": {
+        "path": "drivers_changelog_*.parquet",
+        "unique": [("driver_id", "version")],
+        "unique_per_file": True,  # Each day's changelog numbers versions on its own
+        "fks": {"driver_id": "drivers", "current_vehicle_id": "vehicles", "home_zone_id": "zones"},
+        "ranges": {"version": (2, None)},
+    },
+    "drivers_dim": {
+        "path": "drivers_dim",  # SCD2 dimension: current/ and history/
+        "read": read_dimension,  # Merge-on-read: deltas shadow older open rows; small enough to load whole
+        "unique": [("driver_id", "version")],
+        "fks": {"driver_id": "drivers", "current_vehicle_id": "vehicles", "home_zone_id": "zones"},
+    },
+    "drivers_dim_current": {
+        "path": "drivers_dim/current",  # One open version per driver
+        "read": lambda path: read_dimension(Path(path).parent, current_only=True),
+        "unique": ["driver_id"],
+        "fks": {"driver_id": "drivers"},
+        "shares": {"open (valid_to null)": (lambda b: pc.is_null(b["valid_to"]), 1.0, 1.0)},
+    },
+}
+
+
+def _resolve(data_dir, path):
+    for candidate in (path if isinstance(path, list) else [path]):
+        if "*" in candidate:
+            files = sorted(data_dir.glob(candidate))
+            if files:
+                return [str(f) for f in files]
+        elif (data_dir / candidate).exists():
+            return str(data_dir / candidate)
+    return None
+
+
+def _key(batch, key):
+    # Key column as strings; composite keys are joined with a unit separator
+    if isinstance(key, str):
+        return batch[key].cast(pa.string())
+    return pc.binary_join_element_wise(*[batch[c].cast(pa.string()) for c in key], "\x1f")
+
+
+def _key_name(key):
+    return key if isinstance(key, str) else "(" + ", ".join(key) + ")"
+
+
+def fnv_hash(keys, max_bytes=None):
+    # FNV-1a over each string's last max_bytes bytes (all of them by default),
+    # vectorized on the raw string buffers; nulls hash like empty strings
+    keys = pa.concat_arrays([keys.cast(pa.string())])  # Offset 0, so the buffers line up with the rows
+    h = np.full(len(keys), 14695981039346656037, dtype=np.uint64)
+    _, offsets, data = keys.buffers()
+    if data is None or not len(keys):
+        return h
+    offsets = np.frombuffer(offsets, dtype=np.int32)[:len(keys) + 1]
+    data = np.frombuffer(data, dtype=np.uint8)
+    starts, ends = offsets[:-1], offsets[1:]
+    longest = int((ends - starts).max())
+    for k in range(1, min(longest, max_bytes or longest) + 1):
+        pos = ends - k
+        inside = pos >= starts
+        byte = data[np.where(inside, pos, 0)].astype(np.uint64)
+        h = np.where(inside, (h ^ byte) * np.uint64(1099511628211), h)
+    return h
+
+
+def bucket_of(keys, n_buckets):
+    # Equal keys always land in the same bucket, which is all partitioning needs
+    return (fnv_hash(keys, max_bytes=16) % np.uint64(n_buckets)).astype(np.int64)
+
+
+class KeySet:
+    # FK parent keys, hashed and sorted once. Membership per batch is a vectorized binary
+    # search on the hash plus an exact compare with the candidate key, so no hash table
+    # is rebuilt for every scanned batch.
+    def __init__(self, keys):
+        keys = keys.cast(pa.string())
+        hashes = fnv_hash(keys)
+        order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.keys = keys.take(pa.array(order))
+        self._all = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def contains(self, values):
+        # Boolean array; nulls are never contained
+        values = values.cast(pa.string())
+        if not len(self.keys):
+            return pa.array(np.zeros(len(values), dtype=bool))
+        hashes = fnv_hash(values)
+        idx = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        found = pc.fill_null(pc.equal(values, self.keys.take(pa.array(idx))), False)
+        # A hash shared by several parent keys only compares the first: re-check those rows exactly
+        recheck = np.asarray(self.hashes[idx] == hashes) & ~np.asarray(found)
+        if recheck.any():
+            rows = np.flatnonzero(recheck)
+            exact = np.asarray(pc.is_in(values.take(pa.array(rows)), value_set=self._all))
+            found = np.asarray(found).copy()
+            found[rows] = exact
+            found = pa.array(found)
+        return pc.and_(found, pc.is_valid(values))
+
+
+class UniqueCheck:
+    # Duplicates via hash-partitioned sorted runs: keys are bucketed by hash and
+    # spilled to one Arrow stream per bucket, then each bucket is counted on its own,
+    # so memory is one bucket of keys however many rows the dataset has.
+    def __init__(self, key, expected_rows, spill_dir, bucket_rows=BUCKET_ROWS):
+        self.key = key
+        self.n_buckets = max(1, -(-expected_rows // bucket_rows))
+        self.spill_dir = Path(spill_dir)
+        self.nulls = 0
+        self._parts = []  # Single bucket: kept in memory
+        self._writers = {}
+
+    def update(self, batch, scope=None):
+        keys = _key(batch, self.key)
+        if scope is not None:
+            keys = pc.binary_join_element_wise(scope, keys, "\x1e")  # Unique within scope (e.g. a file) only
+        self.nulls += keys.null_count
+        keys = keys.drop_null()
+        if self.n_buckets == 1:
+            self._parts.append(keys)
+            return
+        buckets = bucket_of(keys, self.n_buckets)
+        order = np.argsort(buckets, kind="stable")
+        keys, buckets = keys.take(order), buckets[order]
+        bounds = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1], True])
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            self._writer(int(buckets[lo])).write_batch(pa.record_batch([keys.slice(lo, hi - lo)], names=["key"]))
+
+    def _writer(self, bucket):
+        if bucket not in self._writers:
+            sink = pa.OSFile(str(self.spill_dir / f"{id(self)}_{bucket}.arrows"), "wb")
+            self._writers[bucket] = pa.ipc.new_stream(sink, pa.schema([("key", pa.string())]))
+        return self._writers[bucket]
+
+    def _buckets(self):
+        if self.n_buckets == 1:
+            yield pa.chunked_array(self._parts, pa.string())
+            return
+        for bucket, writer in sorted(self._writers.items()):
+            writer.close()
+            path = self.spill_dir / f"{id(self)}_{bucket}.arrows"
+            with pa.memory_map(str(path)) as source:
+                yield pa.ipc.open_stream(source).read_all().column("key")
+            path.unlink()
+
+    def finish(self):
+        # (duplicate rows beyond the first, example keys)
+        duplicates, examples = 0, []
+        for keys in self._buckets():
+            counts = pc.value_counts(keys)
+            repeated = counts.filter(pc.greater(counts.field("counts"), 1))
+            duplicates += pc.sum(repeated.field("counts")).as_py() - len(repeated) if len(repeated) else 0
+            examples += repeated.field("values").to_pylist()[:MAX_EXAMPLES - len(examples)]
+        return duplicates, examples
+
+
+class DatasetChecks:
+    # Every check for one dataset, updated batch by batch; failures are collected, never raised
+    def __init__(self, name, spec, parent_keys, expected_rows, spill_dir, bucket_rows=BUCKET_ROWS):
+        self.name = name
+        self.spec = spec
+        self.rows = 0
+        self.unique = [UniqueCheck(k, expected_rows, spill_dir, bucket_rows) for k in spec.get("unique", [])]
+        self.fks = {column: KeySet(parent_keys[parent]) for column, parent in spec.get("fks", {}).items()
+                    if parent in parent_keys}
+        self.missing_parents = sorted({p for p in spec.get("fks", {}).values() if p not in parent_keys})
+        self.values = {column: pa.array(allowed) for column, allowed in spec.get("values", {}).items()}
+        self.violations = {}  # check name → [count, examples]
+        self.sums = {column: 0.0 for column in spec.get("means", {})}
+        self.counts = {column: 0 for column in spec.get("means", {})}
+        self.hits = {share: 0 for share in spec.get("shares", {})}
+        self.keys = []  # First unique key, kept if this dataset is an FK parent
+
+    def columns(self, schema_names):
+        names = {c for k in self.spec.get("unique", []) for c in ([k] if isinstance(k, str) else k)}
+        names |= set(self.spec.get("fks", {})) | set(self.spec.get("ranges", {})) | set(self.spec.get("values", {}))
+        names |= set(self.spec.get("means", {}))
+        names |= {"status", "current_vehicle_id", "valid_to"} & set(schema_names)  # Used by share predicates
+        return sorted(names & set(schema_names))
+
+    def _flag(self, check, bad, column_values):
+        n = pc.sum(bad).as_py() or 0
+        if n:
+            entry = self.violations.setdefault(check, [0, []])
+            entry[0] += n
+            if len(entry[1]) < MAX_EXAMPLES:
+                entry[1] += pc.unique(column_values.filter(bad)).to_pylist()[:MAX_EXAMPLES - len(entry[1])]
+
+    def update(self, batch, keep_keys=False, scope=None):
+        self.rows += batch.num_rows
+        for check in self.unique:
+            check.update(batch, scope)
+        if keep_keys:
+            self.keys.append(_key(batch, self.spec["unique"][0]))
+        for column, parent in self.fks.items():
+            values = batch[column]
+            bad = pc.and_(pc.is_valid(values), pc.invert(parent.contains(values)))
+            self._flag(f"fk {column} → {self.spec['fks'][column]}", bad, values)
+        for column, (lo, hi) in self.spec.get("ranges", {}).items():
+            values = batch[column]
+            bad = pc.less(values, lo) if lo is not None else pa.array(np.zeros(len(values), dtype=bool))
+            if hi is not None:
+                bad = pc.or_(bad, pc.greater(values, hi))
+            self._flag(f"range {column} in [{lo}, {hi}]", pc.fill_null(bad, False), values)
+        for column, allowed in self.values.items():
+            values = batch[column]
+            self._flag(f"values {column}", pc.and_(pc.is_valid(values), pc.invert(pc.is_in(values, value_set=allowed))),
+                       values)
+        for column in self.sums:
+            self.sums[column] += pc.sum(batch[column]).as_py() or 0.0
+            self.counts[column] += len(batch[column]) - batch[column].null_count
+        for share, (predicate, _, _) in self.spec.get("shares", {}).items():
+            self.hits[share] += pc.sum(predicate(batch)).as_py() or 0
+
+    def finish(self, report):
+        report.add(self.name, "rows", True, f"{self.rows:,} rows")
+        for parent in self.missing_parents:
+            report.add(self.name, f"fk → {parent}", None, "skipped: parent dataset not found")
+        for check in self.unique:
+            duplicates, examples = check.finish()
+            name = f"unique {_key_name(check.key)}"
+            report.add(self.name, name, duplicates == 0, f"{duplicates:,} duplicate rows", examples)
+            if check.nulls:
+                report.add(self.name, f"not null {_key_name(check.key)}", False, f"{check.nulls:,} null keys")
+        for check in ([f"fk {c} → {p}" for c, p in self.spec.get("fks", {}).items() if c in self.fks]
+                      + [f"range {c} in [{lo}, {hi}]" for c, (lo, hi) in self.spec.get("ranges", {}).items()]
+                      + [f"values {c}" for c in self.values]):
+            count, examples = self.violations.get(check, [0, []])
+            report.add(self.name, check, count == 0, f"{count:,} bad rows", examples)
+        for column, (lo, hi) in self.spec.get("means", {}).items():
+            mean = self.sums[column] / self.counts[column] if self.counts[column] else float("nan")
+            report.add(self.name, f"mean {column} in ({lo}, {hi})", lo < mean < hi, f"mean {mean:.3f}")
+        for share, (_, lo, hi) in self.spec.get("shares", {}).items():
+            fraction = self.hits[share] / self.rows if self.rows else float("nan")
+            report.add(self.name, f"share {share} in [{lo}, {hi}]", lo <= fraction <= hi, f"{fraction:.3f}")
+
+
+class Report:
+    def __init__(self):
+        self.results = []
+
+    def add(self, dataset, check, passed, detail, examples=()):
+        # passed: True / False / None (skipped)
+        self.results.append({"dataset": dataset, "check": check, "passed": passed, "detail": detail,
+                             "examples": list(examples)})
+
+    @property
+    def ok(self):
+        return all(r["passed"] is not False for r in self.results)
+
+    @property
+    def failures(self):
+        return [r for r in self.results if r["passed"] is False]
+
+    def format(self):
+        lines = []
+        for r in self.results:
+            status = {True: "PASS", False: "FAIL", None: "SKIP"}[r["passed"]]
+            examples = f"  e.g. {r['examples']}" if r["examples"] and r["passed"] is False else ""
+            lines.append(f"{status}  {r['dataset']:<20} {r['check']:<45} {r['detail']}{examples}")
+        lines.append(f"{len(self.failures)} failed of {len(self.results)} checks")
+        return "\n".join(lines)
+
+    def to_json(self, path):
+        Path(path).write_text(json.dumps({"ok": self.ok, "results": self.results}, indent=2, default=str))
+
+
+def validate(data_dir=DATA_DIR, datasets=None, batch_size=BATCH_SIZE, bucket_rows=BUCKET_ROWS):
+    # Scan every dataset present in data_dir in record batches and return a Report
+    data_dir = Path(data_dir)
+    report = Report()
+    parents = {p for spec in DATASETS.values() for p in spec.get("fks", {}).values()}
+    parent_keys = {}
+    spill_dir = Path(tempfile.mkdtemp(prefix="validate_"))
+    try:
+        for name, spec in DATASETS.items():
+            if datasets and name not in datasets and name not in parents:
+                continue
+            source = _resolve(data_dir, spec["path"])
+            if source is None:
+                report.add(name, "exists", None, "skipped: not found")
+                continue
+            if "read" in spec:
+                dataset = ds.dataset(spec["read"](source))
+            else:
+                dataset = ds.dataset(source, format="parquet", partitioning="hive")
+            checks = DatasetChecks(name, spec, parent_keys, dataset.count_rows(), spill_dir, bucket_rows)
+            columns = checks.columns(dataset.schema.names)
+            if spec.get("unique_per_file"):
+                for fragment in dataset.get_fragments():
+                    for batch in fragment.to_batches(columns=columns, batch_size=batch_size):
+                        checks.update(batch, keep_keys=name in parents, scope=Path(fragment.path).name)
+            else:
+                for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+                    checks.update(batch, keep_keys=name in parents)
+            if name in parents:
+                parent_keys[name] = pc.unique(pa.chunked_array(checks.keys, pa.string()))
+            if not datasets or name in datasets:
+                checks.finish(report)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate the generated Parquet datasets")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    parser.add_argument("--dataset", action="append", choices=sorted(DATASETS), help="Limit to these (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--bucket-rows", type=int, default=BUCKET_ROWS)
+    parser.add_argument("--json", help="Also write the report as JSON")
+    args = parser.parse_args()
+    report = validate(args.data_dir, args.dataset, args.batch_size, args.bucket_rows)
+    print(report.format())
+    if args.json:
+        report.to_json(args.json)
+    raise SystemExit(0 if report.ok else 1)
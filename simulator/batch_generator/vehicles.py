@@ -1,30 +1,27 @@
+import numpy as np
 import pandas as pd
-import random
-from faker import Faker
-
-fake = Faker()
+from sharding import prefixed_ids
+from attribute_pools import load_pool, sample_unique
 
 def generate_vehicles(n_vehicles=8000, seed=42):  # More vehicles than drivers for pool
-    random.seed(seed)
+    rng = np.random.default_rng(seed)
     types = ["sedan", "suv", "hatchback", "electric"]
-    years = list(range(2015, 2026))
-    vehicles = []
-    for i in range(n_vehicles):
-        vehicle_id = f"V{str(i+1).zfill(6)}"
-        vehicles.append({
-            "vehicle_id": vehicle_id,
-            "type": random.choice(types),
-            "year": random.choice(years),
-            "license_plate": fake.license_plate(),
-            "current_driver_id": None,  # Assigned later via batch changelog
-            "status": "active" if random.random() < 0.95 else "maintenance"
-        })
-    df = pd.DataFrame(vehicles)
+    years = np.arange(2015, 2026)
+    plates = load_pool("plate", n_vehicles, seed, unique=True)  # Plates must be unique
+    df = pd.DataFrame({
+        "vehicle_id": prefixed_ids("V", 0, n_vehicles, 6),
+        "type": rng.choice(types, size=n_vehicles),
+        "year": rng.choice(years, size=n_vehicles),
+        "license_plate": sample_unique(plates, 0, n_vehicles, seed),
+        "current_driver_id": None,  # Assigned later via batch changelog
+        "status": np.where(rng.random(n_vehicles) < 0.95, "active", "maintenance")
+    })
     # Validation: Unique IDs
     assert df['vehicle_id'].nunique() == len(df), "Vehicle ID collision!"
+    assert df['license_plate'].nunique() == len(df), "License plate collision!"
     return df, list(df['vehicle_id'])  # Return pool for drivers
 
 if __name__ == "__main__":
     df, pool = generate_vehicles()
     df.to_parquet("../../data_samples/vehicles.parquet", compression="snappy")
-    print(f"Generated {len(df)} vehicles (pool size {len(pool)}) → data_samples/")
\ No newline at end of file
+    print(f"Generated {len(df)} vehicles (pool size {len(pool)}) → data_samples/")
@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Run from the repo root: python -m simulator.benchmark [--scales 0.1,1] [--baseline FILE] [--save-baseline]
+ROOT = Path(__file__).resolve().parent
+BATCH_DIR = ROOT / "batch_generator"
+BASELINE = ROOT / "benchmark_baseline.json"
+GROUPS = ["generators", "state", "engine", "http"]
+SCALES = [0.1, 0.5, 1.0]  # Multiples of main_batch's default sizes
+SIZES = {"zones": 500, "vehicles": 8000, "riders": 100_000, "drivers": 10_000, "trips": 1_000_000}
+EVENTS = 20_000  # Events per engine / HTTP benchmark, at every scale
+THRESHOLD = 0.2  # A run this much slower than its baseline is a regression
+REPEATS = 3  # Best of, to keep timer noise out of the comparison
+
+
+# Linux can restart a process's RSS high-water mark, so each benchmark reports its own peak.
+# Elsewhere peak RSS is process-wide: a benchmark inherits the peak of earlier ones in its group.
+PER_BENCHMARK_RSS = Path("/proc/self/clear_refs").exists()
+
+
+def reset_peak_rss():
+    if PER_BENCHMARK_RSS:
+        Path("/proc/self/clear_refs").write_text("5")
+
+
+def peak_rss_mb():
+    if PER_BENCHMARK_RSS:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024  # Peak since reset_peak_rss, in KiB
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024  # Bytes on macOS, KiB on Linux
+
+
+def best_of(fn, repeats=REPEATS):
+    # (fastest wall time, result of that run); peak RSS is counted from here
+    reset_peak_rss()
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed < best:
+            best, result = elapsed, out
+    return best, result
+
+
+def _rate(name, rows, seconds, unit):
+    return {"name": name, "value": rows / seconds, "unit": unit, "higher_is_better": True, "rows": rows,
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def _seconds(name, seconds):
+    return {"name": name, "value": seconds, "unit": "s", "higher_is_better": False, "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_generators(scale, data_dir, events, repeats):
+    # rows/sec of each batch generate_*; also writes the scale's inputs for the other groups
+    sys.path.insert(0, str(BATCH_DIR))  # The batch generator uses flat imports
+    from zones import generate_zones
+    from vehicles import generate_vehicles
+    from riders import generate_riders
+    from drivers import generate_drivers
+    from historical_trips import generate_historical_trips
+    n = {k: max(1, int(v * scale)) for k, v in SIZES.items()}
+    as_of = "20251209"  # Fixed anchor, so every run generates the same rows
+    results = []
+    t, (zones_df, zone_pool) = best_of(lambda: generate_zones(n["zones"]), repeats)
+    results.append(_rate("generate_zones", n["zones"], t, "rows/s"))
+    t, (vehicles_df, vehicle_pool) = best_of(lambda: generate_vehicles(n["vehicles"]), repeats)
+    results.append(_rate("generate_vehicles", n["vehicles"], t, "rows/s"))
+    t, (riders_df, rider_pool) = best_of(lambda: generate_riders(n["riders"], zone_pool=zone_pool), repeats)
+    results.append(_rate("generate_riders", n["riders"], t, "rows/s"))
+    t, (drivers_df, driver_pool) = best_of(
+        lambda: generate_drivers(n["drivers"], vehicle_pool=vehicle_pool, zone_pool=zone_pool, as_of=as_of), repeats)
+    results.append(_rate("generate_drivers", n["drivers"], t, "rows/s"))
+    t, _ = best_of(lambda: generate_historical_trips(n["trips"], driver_pool=driver_pool, rider_pool=rider_pool,
+                                                     zone_pool=zone_pool, end_time=as_of), repeats)
+    results.append(_rate("generate_historical_trips", n["trips"], t, "rows/s"))
+    for name, df in (("zones", zones_df), ("vehicles", vehicles_df), ("riders", riders_df), ("drivers", drivers_df)):
+        df.to_parquet(data_dir / f"{name}.parquet", compression="snappy")
+    return results
+
+
+def bench_state(scale, data_dir, events, repeats):
+    # Cold: no snapshot, so Parquet is read and the snapshot written; warm: memory-mapped snapshot
+    from .streaming_simulator.state_loader import load_state, SNAPSHOT_DIR
+    shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    load_state()
+    results = [_seconds("load_state cold", time.perf_counter() - t0)]
+    t, _ = best_of(load_state, repeats)
+    results.append(_seconds("load_state warm", t))
+    return results
+
+
+def bench_engine(scale, data_dir, events, repeats):
+    # Unpaced events/sec per event type, one pydantic model per event and columnar batches
+    from .streaming_simulator.state_loader import load_state
+    from .streaming_simulator.simulator_engine import SimulatorEngine
+    engine = SimulatorEngine(load_state())
+    results = []
+    for event_type in ("ping", "trip", "surge"):
+        t, produced = best_of(lambda: engine.run_simulation(event_type, events), repeats)
+        results.append(_rate(f"run_simulation {event_type}", len(produced), t, "events/s"))
+        t, batch = best_of(lambda: engine.generate_batch(event_type, events), repeats)
+        results.append(_rate(f"generate_batch {event_type}", batch.num_rows, t, "events/s"))
+    # Surge events/sec depend on how many zones change per tick, so the city-wide tick is timed too
+    ticks = max(1, events // 100)
+    t, _ = best_of(lambda: [engine.surge.tick() for _ in range(ticks)], repeats)
+    results.append(_rate("surge tick", ticks * len(engine.surge.zone_ids), t, "zones/s"))
+    return results
+
+
+def bench_http(scale, data_dir, events, repeats):
+    # End to end through the ASGI app in-process: routing, generation and serialization, no sockets
+    from fastapi.testclient import TestClient
+    from .streaming_simulator import app as app_module
+    from .streaming_simulator.pacing import Pacer
+    from .streaming_simulator.broadcaster import Broadcaster
+    paths = {"ping": "pings", "trip": "trip_events", "surge": "surge"}
+
+    def get(path, fmt):
+        with TestClient(app_module.app) as client:
+            response = client.get(f"/stream/{path}/{events}", params={"pace": "false", "format": fmt})
+        response.raise_for_status()
+        return response.content.count(b"\n") if fmt == "ndjson" else len(response.json())
+
+    def receive(event_type):
+        # A fresh unpaced broadcaster and event loop per run: the endpoint only sees a
+        # disconnect on its next send, so a finished run's generator must not linger
+        app_module.broadcasters[event_type] = Broadcaster(app_module.engine, event_type, pacer_factory=Pacer.bulk)
+        received = 0
+        with TestClient(app_module.app) as client, client.websocket_connect(f"/ws/stream/{event_type}") as websocket:
+            while received < events:
+                received += len(json.loads(websocket.receive_text()))
+        return received
+
+    # Pings first: trips then occupy drivers, and a small fleet may have none left active to ping
+    results = []
+    for event_type, path in paths.items():
+        for fmt in ("json", "ndjson"):
+            t, produced = best_of(lambda: get(path, fmt), repeats)
+            results.append(_rate(f"http {event_type} {fmt}", produced, t, "events/s"))
+        t, produced = best_of(lambda: receive(event_type), repeats)
+        results.append(_rate(f"ws {event_type}", produced, t, "events/s"))
+    return results
+
+
+BENCHMARKS = {"generators": bench_generators, "state": bench_state, "engine": bench_engine, "http": bench_http}
+
+
+def run_group(group, scale, data_dir, events, repeats):
+    # One subprocess per group and scale: a clean import (app.py loads state at import) and its own peak RSS
+    env = {**os.environ, "SIM_DATA_DIR": str(data_dir)}
+    cmd = [sys.executable, "-m", "simulator.benchmark", "--child", group, "--scales", str(scale),
+           "--data-dir", str(data_dir), "--events", str(events), "--repeats", str(repeats)]
+    proc = subprocess.run(cmd, cwd=ROOT.parent, env=env, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(f"{group} benchmark at scale {scale} failed:\n{proc.stderr}")
+    results = json.loads(proc.stdout.strip().splitlines()[-1])
+    for r in results:
+        r.update(group=group, scale=scale)
+    return results
+
+
+def key(result):
+    return f"{result['name']} @ {result['scale']}"
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    # Annotates each result with its change vs the baseline; returns the regressions
+    regressions = []
+    for r in results:
+        base = baseline.get(key(r))
+        if not base or not base["value"]:
+            continue
+        change = r["value"] / base["value"] - 1
+        r["change"] = change
+        slowdown = -change if r["higher_is_better"] else change
+        if slowdown > threshold:
+            regressions.append(r)
+    return regressions
+
+
+def format_results(results):
+    lines = [f"{'benchmark':<32} {'scale':>5} {'value':>14} {'unit':<9} {'peak RSS':>9} {'change':>8}"]
+    for r in results:
+        change = f"{r['change']:+.1%}" if "change" in r else ""
+        lines.append(f"{r['name']:<32} {r['scale']:>5} {r['value']:>14,.3f} {r['unit']:<9} "
+                     f"{r['peak_rss_mb']:>7.0f}MB {change:>8}")
+    if not PER_BENCHMARK_RSS:
+        lines.append("peak RSS is per group process, not per benchmark, on this platform")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmarks for the batch generator and the simulator")
+    parser.add_argument("--scales", default=",".join(map(str, SCALES)), help="Comma-separated scale factors")
+    parser.add_argument("--groups", default=",".join(GROUPS), help=f"Comma-separated subset of {', '.join(GROUPS)}")
+    parser.add_argument("--events", type=int, default=EVENTS)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--data-dir", help="Keeps generated inputs in scale_<factor>/ subdirs (default: a temporary directory)")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Allowed slowdown, e.g. 0.2 = 20%%")
+    parser.add_argument("--output", help="Also write this run's results as JSON")
+    parser.add_argument("--child", choices=GROUPS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    scales = [float(s) for s in args.scales.split(",")]
+
+    if args.child:
+        results = BENCHMARKS[args.child](scales[0], Path(args.data_dir), args.events, args.repeats)
+        print(json.dumps(results))
+        return
+
+    groups = args.groups.split(",")
+    if "generators" not in groups and not args.data_dir:
+        parser.error("--data-dir with generated inputs is required without the generators group")
+    root = Path(args.data_dir or tempfile.mkdtemp(prefix="benchmark_"))
+    results = []
+    try:
+        for scale in scales:
+            data_dir = root / f"scale_{scale}"
+            data_dir.mkdir(parents=True, exist_ok=True)
+            for group in GROUPS:
+                if group in groups:
+                    print(f"Running {group} at scale {scale}...", file=sys.stderr)
+                    results += run_group(group, scale, data_dir, args.events, args.repeats)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    regressions = compare(results, baseline, args.threshold)
+    print(format_results(results))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        baseline.update({key(r): {k: v for k, v in r.items() if k != "change"} for r in results})
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True))
+        print(f"Baseline saved to {baseline_path}")
+    elif regressions:
+        for r in regressions:
+            print(f"REGRESSION {key(r)}: {r['change']:+.1%} vs baseline", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
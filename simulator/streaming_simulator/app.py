@@ -1,36 +1,177 @@
-from fastapi import FastAPI, WebSocket
+from typing import Optional
+import numpy as np
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Path, Query
+from fastapi.responses import Response, PlainTextResponse
 from .simulator_engine import SimulatorEngine
 from .state_loader import load_state
-from .models import DriverLocationPing, TripEvent, SurgeEvent
+from .models import DriverLocationPing, TripEvent, SurgeEvent, to_dict
+from .pacing import Pacer, DEFAULT_RATE, DEFAULT_BURST, DEFAULT_JITTER
+from .serialization import negotiate, bulk_response, dumps
+from .broadcaster import Broadcaster
+from .kpis import KpiAggregator, to_records, KPI_DIR
+from .replay import ReplayEngine, REPLAY_PATH, DEFAULT_SPEEDUP
+from .sharded import ShardedSimulator, SHARDS
+from .driver_store import STATUSES
+from .metrics import REGISTRY, CONTENT_TYPE, gauge, callback_counter, timer, SERIALIZE_SECONDS
+from .profiler import SamplingProfiler, PROFILER_ENABLED, DEFAULT_INTERVAL_MS
 
 app = FastAPI(title="Ride-Share Streaming Simulator")
 
 state = load_state()
 engine = SimulatorEngine(state)
+if REPLAY_PATH:  # Trip streams replay the historical lake; pings and surge stay live
+    engine = ReplayEngine(engine, REPLAY_PATH, DEFAULT_SPEEDUP)
+elif SHARDS > 1:
+    # One zone-partitioned state across SIM_SHARDS processes; run a single uvicorn worker with it,
+    # since every uvicorn worker would otherwise start its own, diverging set of shards
+    engine = ShardedSimulator(SHARDS, state=state)
+kpis = KpiAggregator(engine.zone_ids)  # Fed by every trip/surge event the engine emits
+engine.add_observer(kpis.observe, kpis.observe_batch)
+
+def make_pacer(pace: bool, rate: Optional[float], burst: int, jitter: float):
+    # pace=false is bulk mode: no delay between events, for load testing
+    if not pace:
+        return Pacer.bulk()
+    return Pacer(rate=rate or DEFAULT_RATE, burst=burst, jitter=jitter)
+
+# count is the number of event slots, the same on every format: pings and trip events fill
+# every slot (pings while any driver is active), surge only the zones whose multiplier changed
+# (a slot with none queued runs the simulation one tick ahead), so a surge response can hold
+# fewer than count events, or none.
+COUNT = Path(description="Events to generate; surge returns only the changes available, so up to count")
+FORMAT = Query(None, alias="format", description="json (default), orjson, ndjson or arrow; else the Accept header")
+# Out-of-range pacing is rejected up front (422) instead of stalling or flooding the stream
+RATE = Query(None, gt=0, description="Events per second when paced")
+BURST = Query(DEFAULT_BURST, ge=1)
+JITTER = Query(DEFAULT_JITTER, ge=0, le=1, description="Relative spread of each delay")
+
+async def stream_response(event_type: str, count: int, request: Request, fmt: Optional[str], pacer: Pacer):
+    # Default: one pydantic model per event. format=orjson|ndjson|arrow (or a matching
+    # Accept header) takes the bulk columnar path instead.
+    try:
+        fmt = negotiate(fmt, request.headers.get("accept"))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if fmt == "json":
+        events = await engine.run_simulation_async(event_type, count, pacer)
+        with timer(SERIALIZE_SECONDS, "models"):
+            return [to_dict(e) for e in events]
+    return await bulk_response(fmt, event_type, engine.stream_batches(event_type, count, pacer))
 
 @app.get("/stream/pings/{count}")
-async def get_pings(count: int = 1):
-    events = engine.run_simulation("ping", count)
-    return [e.dict() for e in events]
+async def get_pings(request: Request, count: int = COUNT, fmt: Optional[str] = FORMAT, pace: bool = True,
+                    rate: Optional[float] = RATE, burst: int = BURST, jitter: float = JITTER):
+    return await stream_response("ping", count, request, fmt, make_pacer(pace, rate, burst, jitter))
 
 @app.get("/stream/trip_events/{count}")
-async def get_trip_events(count: int = 1):
-    events = engine.run_simulation("trip", count)
-    return [e.dict() for e in events]
+async def get_trip_events(request: Request, count: int = COUNT, fmt: Optional[str] = FORMAT, pace: bool = True,
+                          rate: Optional[float] = RATE, burst: int = BURST, jitter: float = JITTER):
+    return await stream_response("trip", count, request, fmt, make_pacer(pace, rate, burst, jitter))
 
 @app.get("/stream/surge/{count}")
-async def get_surge(count: int = 1):
-    events = engine.run_simulation("surge", count)
-    return [e.dict() for e in events]
+async def get_surge(request: Request, count: int = COUNT, fmt: Optional[str] = FORMAT, pace: bool = True,
+                    rate: Optional[float] = RATE, burst: int = BURST, jitter: float = JITTER):
+    return await stream_response("surge", count, request, fmt, make_pacer(pace, rate, burst, jitter))
+
+@app.get("/kpis")
+async def get_kpis(window: int = 300, mode: str = "sliding", zones: Optional[str] = None, last: Optional[int] = None):
+    # Per-zone KPIs from the in-process aggregator; zones is a comma-separated list
+    zone_ids = zones.split(",") if zones else None
+    try:
+        if mode == "sliding":
+            table = kpis.sliding(window, zone_ids)
+        elif mode == "tumbling":
+            table = kpis.tumbling(window, zone_ids, last)
+        else:
+            raise ValueError(f"Unknown mode {mode!r}; expected sliding or tumbling")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return Response(dumps(to_records(table)), media_type="application/json")
+
+@app.post("/kpis/flush")
+async def flush_kpis(window: Optional[int] = None):
+    # Closed tumbling windows since the last flush → one Parquet file under SIM_KPI_DIR
+    try:
+        path = kpis.flush_parquet(KPI_DIR, window)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"path": str(path) if path else None, "late_dropped": kpis.late_dropped}
+
+# Optional: WebSocket for push streaming. One shared generator per event type; every
+# frame is a JSON array of events, and slow clients lose their own backlog only.
+broadcasters = {event_type: Broadcaster(engine, event_type) for event_type in ("ping", "trip", "surge")}
+
+# Gauges are read from live state at scrape time; None (e.g. no such state in sharded mode) skips one
+def _driver_counts():
+    drivers = getattr(engine, "drivers", None)
+    if drivers is None:
+        return None
+    counts = np.bincount(drivers.status, minlength=len(STATUSES))
+    return {(status,): int(n) for status, n in zip(STATUSES, counts)}
+
+gauge("sim_active_trips", "Trips in flight",
+      lambda: len(engine.active_trips) if hasattr(engine, "active_trips") else None)
+gauge("sim_scheduler_queue_depth", "Pending trip transitions and request arrivals",
+      lambda: len(engine.scheduler) if hasattr(engine, "scheduler") else None)
+gauge("sim_pending_surge_events", "Surge changes queued from the last tick",
+      lambda: len(engine._pending_surge) if hasattr(engine, "_pending_surge") else None)
+gauge("sim_drivers", "Drivers by status", _driver_counts, ["status"])
+callback_counter("sim_shard_handoffs_total", "Requests handed to another shard",
+                 lambda: getattr(engine, "handoffs", None))
+gauge("sim_ws_subscribers", "Connected WebSocket clients",
+      lambda: {(t,): len(b.subscribers) for t, b in broadcasters.items()}, ["event_type"])
+gauge("sim_ws_queued_frames", "Frames waiting in WebSocket client queues",
+      lambda: {(t,): sum(s.queue.qsize() for s in b.subscribers) for t, b in broadcasters.items()}, ["event_type"])
+callback_counter("sim_kpi_late_dropped_total", "Events too old for the KPI ring buffer", lambda: kpis.late_dropped)
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus scrape target; per uvicorn worker process
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+# Opt-in sampling profiler (SIM_PROFILER=1): start, exercise the app, then stop to get
+# folded stacks for flamegraph.pl / speedscope
+profiler = SamplingProfiler()
+
+@app.post("/debug/profile/start")
+async def start_profile(interval_ms: float = DEFAULT_INTERVAL_MS):
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler disabled; set SIM_PROFILER=1")
+    try:
+        profiler.start(interval_ms)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"interval_ms": interval_ms}
+
+@app.post("/debug/profile/stop")
+async def stop_profile():
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler disabled; set SIM_PROFILER=1")
+    try:
+        return PlainTextResponse(profiler.stop())
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
 
-# Optional: WebSocket for push streaming
 @app.websocket("/ws/stream/{event_type}")
 async def websocket_endpoint(websocket: WebSocket, event_type: str):
+    broadcaster = broadcasters.get(event_type)
+    if broadcaster is None:
+        await websocket.close(code=1008)
+        return
     await websocket.accept()
-    while True:
-        event = engine.run_simulation(event_type, 1)[0]
-        await websocket.send_json(event.dict())
+    subscriber = broadcaster.subscribe()
+    try:
+        while True:
+            frame = await subscriber.queue.get()
+            if frame is None:  # The broadcaster stopped; 1011 if it failed
+                await websocket.close(code=1000 if subscriber.error is None else 1011)
+                break
+            await websocket.send_text(frame.payload())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broadcaster.unsubscribe(subscriber)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+from .pacing import Pacer
+from .serialization import dumps
+from .metrics import timer, SERIALIZE_SECONDS
+
+FRAME_SIZE = int(os.environ.get("SIM_WS_FRAME_SIZE", 100))  # Max events per frame
+LINGER_MS = float(os.environ.get("SIM_WS_LINGER_MS", 100))  # Max wait before a partial frame goes out
+QUEUE_SIZE = int(os.environ.get("SIM_WS_QUEUE_SIZE", 32))  # Frames buffered per subscriber
+SLOW_CLIENT_POLICY = os.environ.get("SIM_WS_SLOW_CLIENT", "drop")  # "drop" oldest frame or "coalesce"
+
+log = logging.getLogger(__name__)
+
+
+class Frame:
+    # One batch of events, JSON-encoded at most once however many clients get it
+    __slots__ = ("events", "_payload")
+
+    def __init__(self, events):
+        self.events = events
+        self._payload = None
+
+    def payload(self):
+        if self._payload is None:
+            with timer(SERIALIZE_SECONDS, "ws"):
+                self._payload = dumps(self.events).decode()
+        return self._payload
+
+
+class Subscriber:
+    def __init__(self, queue_size=QUEUE_SIZE, policy=SLOW_CLIENT_POLICY, max_events=QUEUE_SIZE * FRAME_SIZE):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.policy = policy
+        self.max_events = max_events  # Cap on a coalesced frame
+        self.dropped = 0  # Events this client never received
+        self.error = None  # Why the stream ended, once close() queued the None sentinel
+
+    def offer(self, frame):
+        # Never blocks the broadcaster: a full queue sheds this client's backlog only
+        if not self.queue.full():
+            self.queue.put_nowait(frame)
+            return
+        if self.policy == "coalesce":
+            events = []
+            while not self.queue.empty():
+                events.extend(self.queue.get_nowait().events)
+            events.extend(frame.events)
+            self.dropped += max(0, len(events) - self.max_events)
+            self.queue.put_nowait(Frame(events[-self.max_events:]))
+        else:
+            self.dropped += len(self.queue.get_nowait().events)
+            self.queue.put_nowait(frame)
+
+    def close(self, error=None):
+        # The stream ended: None after the queued frames tells the reader to hang up
+        self.error = error
+        if self.queue.full():
+            self.dropped += len(self.queue.get_nowait().events)
+        self.queue.put_nowait(None)
+
+
+class Broadcaster:
+    # Generates one stream per event type and fans each frame out to every subscriber.
+    # Generation starts with the first subscriber and stops when the last one leaves;
+    # if it fails (or a finite stream ends), every subscriber is closed, not left waiting.
+    def __init__(self, engine, event_type, pacer_factory=Pacer, frame_size=FRAME_SIZE, linger_ms=LINGER_MS):
+        self.engine = engine
+        self.event_type = event_type
+        self.pacer_factory = pacer_factory
+        self.frame_size = frame_size
+        self.linger = linger_ms / 1000
+        self.subscribers = set()
+        self._task = None
+
+    def subscribe(self, **options):
+        subscriber = Subscriber(**options)
+        self.subscribers.add(subscriber)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            self._task.add_done_callback(self._finished)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _publish(self, events):
+        frame = Frame(events)
+        for subscriber in self.subscribers:
+            subscriber.offer(frame)
+
+    def _finished(self, task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            log.error("%s broadcaster failed", self.event_type, exc_info=error)
+        if self._task is task:
+            self._task = None  # The next subscriber starts a fresh stream
+        subscribers, self.subscribers = self.subscribers, set()
+        for subscriber in subscribers:
+            subscriber.close(error)
+
+    async def _run(self):
+        # A partial frame goes out linger after its first event, whether or not another batch comes
+        loop = asyncio.get_running_loop()
+        events, deadline = [], None
+        batches = self.engine.stream_batches(self.event_type, pacer=self.pacer_factory(), chunk_size=self.frame_size)
+        pending = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(anext(batches))
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if done:
+                    try:
+                        batch = pending.result()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        pending = None
+                    if not events:
+                        deadline = loop.time() + self.linger
+                    events.extend(batch.to_pylist())
+                if events and (len(events) >= self.frame_size or loop.time() >= deadline):
+                    self._publish(events)
+                    events, deadline = [], None
+            if events:
+                self._publish(events)
+        finally:
+            if pending is not None:  # Let the cancelled step unwind before closing the generator
+                pending.cancel()
+                await asyncio.wait({pending})
+            await batches.aclose()
@@ -0,0 +1,72 @@
+import os
+from datetime import datetime
+import numpy as np
+import pyarrow as pa
+
+# Helpers for building event columns in bulk instead of one pydantic model per event
+
+PING_SCHEMA = pa.schema([
+    ("event_id", pa.string()),
+    ("driver_id", pa.string()),
+    ("vehicle_id", pa.string()),
+    ("lat", pa.float64()),
+    ("lng", pa.float64()),
+    ("h3_index", pa.string()),
+    ("timestamp", pa.string()),
+    ("event_time", pa.string()),
+])
+
+TRIP_SCHEMA = pa.schema([
+    ("event_id", pa.string()),
+    ("trip_id", pa.string()),
+    ("event_type", pa.string()),
+    ("driver_id", pa.string()),
+    ("rider_id", pa.string()),
+    ("pickup_zone_id", pa.string()),
+    ("dropoff_zone_id", pa.string()),
+    ("lat", pa.float64()),
+    ("lng", pa.float64()),
+    ("timestamp", pa.string()),
+    ("event_time", pa.string()),
+])
+
+SURGE_SCHEMA = pa.schema([
+    ("event_id", pa.string()),
+    ("zone_id", pa.string()),
+    ("surge_multiplier", pa.float64()),
+    ("demand_score", pa.float64()),
+    ("timestamp", pa.string()),
+    ("event_time", pa.string()),
+])
+
+_HEX = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_DASHES = [8, 13, 18, 23]
+_HEX_POS = [i for i in range(36) if i not in _DASHES]
+
+
+def utc_now_iso():
+    return datetime.utcnow().isoformat(timespec="microseconds") + "Z"
+
+
+def uuid4_array(n):
+    # n random RFC 4122 v4 UUID strings, formatted with NumPy and wrapped without copying.
+    # Bytes come from os.urandom like uuid.uuid4(), never from a seeded simulation RNG,
+    # so ids stay unique across restarts and workers.
+    raw = np.frombuffer(bytearray(os.urandom(16 * n)), dtype=np.uint8).reshape(n, 16)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # Version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hex_chars = np.empty((n, 32), dtype=np.uint8)
+    hex_chars[:, 0::2] = _HEX[raw >> 4]
+    hex_chars[:, 1::2] = _HEX[raw & 0x0F]
+    text = np.empty((n, 36), dtype=np.uint8)
+    text[:, _HEX_POS] = hex_chars
+    text[:, _DASHES] = ord("-")
+    offsets = np.arange(0, 36 * (n + 1), 36, dtype=np.int32)
+    return pa.StringArray.from_buffers(n, pa.py_buffer(offsets), pa.py_buffer(text))
+
+
+def repeat_string(value, n):
+    return pa.array([value], pa.string()).take(np.zeros(n, dtype=np.int32))
+
+
+SCHEMAS = {"ping": PING_SCHEMA, "trip": TRIP_SCHEMA, "surge": SURGE_SCHEMA}
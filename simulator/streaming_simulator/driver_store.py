@@ -0,0 +1,118 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import h3
+
+STATUSES = ("active", "offline", "blocked", "in_trip")
+ACTIVE, OFFLINE, BLOCKED, IN_TRIP = range(len(STATUSES))
+RING_SIZE = 7  # grid_disk(cell, 1): the cell itself plus its 6 neighbors
+
+
+class CellTable:
+    # Interned H3 cells: int32 ids, centroids, and a lazily filled k=1 adjacency table
+    def __init__(self, capacity=1024):
+        self.ids = []
+        self.index = {}
+        self.lat = np.empty(capacity)
+        self.lng = np.empty(capacity)
+        self.neighbors = np.zeros((capacity, RING_SIZE), dtype=np.int32)
+        self.has_neighbors = np.zeros(capacity, dtype=bool)
+        self._arrow = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _grow(self):
+        capacity = 2 * len(self.lat)
+        self.lat = np.resize(self.lat, capacity)
+        self.lng = np.resize(self.lng, capacity)
+        neighbors = np.zeros((capacity, RING_SIZE), dtype=np.int32)
+        neighbors[:len(self.neighbors)] = self.neighbors
+        self.neighbors = neighbors
+        has_neighbors = np.zeros(capacity, dtype=bool)
+        has_neighbors[:len(self.has_neighbors)] = self.has_neighbors
+        self.has_neighbors = has_neighbors
+
+    def intern(self, cell):
+        cell_id = self.index.get(cell)
+        if cell_id is None:
+            cell_id = len(self.ids)
+            if cell_id == len(self.lat):
+                self._grow()
+            self.ids.append(cell)
+            self.index[cell] = cell_id
+            self.lat[cell_id], self.lng[cell_id] = h3.cell_to_latlng(cell)
+            self._arrow = None
+        return cell_id
+
+    def intern_array(self, cells):
+        # Arrow string column → int32 ids; h3 is only called per distinct cell
+        cells = pa.chunked_array([cells]) if isinstance(cells, pa.Array) else cells
+        distinct = pc.unique(cells)
+        ids = np.array([self.intern(c) for c in distinct.to_pylist()], dtype=np.int32)
+        return ids[pc.index_in(cells, value_set=distinct).to_numpy()]
+
+    def ring(self, cell_ids):
+        # (n, RING_SIZE) neighbor ids; adjacency is computed once per cell, on first visit
+        missing = np.unique(cell_ids[~self.has_neighbors[cell_ids]])
+        for cell_id in missing:
+            ring = [self.intern(c) for c in h3.grid_disk(self.ids[cell_id], 1)]
+            ring += [cell_id] * (RING_SIZE - len(ring))  # Pentagons have 5 neighbors
+            self.neighbors[cell_id] = ring
+            self.has_neighbors[cell_id] = True
+        return self.neighbors[cell_ids]
+
+    def as_arrow(self):
+        if self._arrow is None:
+            self._arrow = pa.array(self.ids, pa.string())
+        return self._arrow
+
+
+class DriverStore:
+    # Columnar driver state: row i of every array belongs to driver_ids[i]
+    def __init__(self, driver_table):
+        self.cells = CellTable()
+        self.driver_ids = driver_table["driver_id"].combine_chunks()
+        self.vehicle_ids = driver_table["vehicle_id"].combine_chunks()
+        self.index = {d: i for i, d in enumerate(self.driver_ids.to_pylist())}
+        status = pc.index_in(driver_table["status"], value_set=pa.array(STATUSES))
+        self.status = pc.fill_null(status, OFFLINE).to_numpy().astype(np.int8)  # Unknown statuses never ping
+        self.lat = driver_table["current_lat"].to_numpy().copy()
+        self.lng = driver_table["current_lng"].to_numpy().copy()
+        self.cell = self.cells.intern_array(driver_table["h3_index"])
+
+    def __len__(self):
+        return len(self.status)
+
+    def get(self, driver_id):
+        # Dict view of one driver, shaped like the old driver_states entries
+        i = self.index[driver_id]
+        return {
+            "status": STATUSES[self.status[i]],
+            "vehicle_id": self.vehicle_ids[i].as_py(),
+            "current_lat": float(self.lat[i]),
+            "current_lng": float(self.lng[i]),
+            "h3_index": self.cells.ids[self.cell[i]]
+        }
+
+    def step(self, idx, rng):
+        # One random-walk move for each driver in idx (no duplicates)
+        new_cells = self.cells.ring(self.cell[idx])[np.arange(len(idx)), rng.integers(0, RING_SIZE, len(idx))]
+        self.cell[idx] = new_cells
+        self.lat[idx] = self.cells.lat[new_cells]
+        self.lng[idx] = self.cells.lng[new_cells]
+        return new_cells
+
+    def walk(self, n, rng):
+        # n moves spread over active drivers: each round moves a driver at most once,
+        # so repeated picks within a batch chain like sequential pings would
+        active = np.flatnonzero(self.status == ACTIVE)
+        if n <= 0 or not len(active):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        moved, cells = [], []
+        while n > 0:
+            idx = rng.permutation(active)[:n]
+            cells.append(self.step(idx, rng))
+            moved.append(idx)
+            n -= len(idx)
+        return np.concatenate(moved), np.concatenate(cells)
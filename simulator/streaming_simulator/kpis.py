@@ -0,0 +1,271 @@
+import os
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+SLOT_SECONDS = int(os.environ.get("SIM_KPI_SLOT_SECONDS", 60))  # Finest window granularity
+RETENTION_SLOTS = int(os.environ.get("SIM_KPI_RETENTION_SLOTS", 360))  # 6 h of 1-min slots; older events are late
+KPI_DIR = os.environ.get("SIM_KPI_DIR", "kpi_output")
+
+COUNTERS = ("requests", "matches", "completions", "cancels", "surge_sum", "surge_events")
+REQUESTS, MATCHES, COMPLETIONS, CANCELS, SURGE_SUM, SURGE_EVENTS = range(len(COUNTERS))
+DRIVERS_IN_TRIP, SURGE = range(2)  # Gauges: drivers in a trip, last surge multiplier
+TRIP_COUNTERS = {"request": REQUESTS, "matched": MATCHES, "dropoff": COMPLETIONS, "cancel": CANCELS}
+EPOCH = datetime(1970, 1, 1)
+
+KPI_SCHEMA = pa.schema([
+    ("window_start", pa.timestamp("s")),
+    ("window_end", pa.timestamp("s")),
+    ("zone_id", pa.string()),
+    ("requests", pa.int64()),
+    ("matches", pa.int64()),
+    ("completions", pa.int64()),
+    ("cancels", pa.int64()),
+    ("cancel_rate", pa.float64()),  # cancels / (completions + cancels)
+    ("avg_surge", pa.float64()),  # Mean of surge events in the window, else the last known multiplier
+    ("drivers_in_trip", pa.int64()),  # Drivers matched and not yet released at the end of the window
+])
+
+
+class KpiAggregator:
+    # Per-zone trip and surge KPIs over event time, kept in a ring of fixed-width
+    # slots: an event is one array increment, a window is a sum over slots, and
+    # events older than the ring are counted in late_dropped rather than kept.
+    def __init__(self, zone_ids, slot_seconds=SLOT_SECONDS, retention_slots=RETENTION_SLOTS):
+        self.zone_ids = list(zone_ids)
+        self.index = {zone_id: i for i, zone_id in enumerate(self.zone_ids)}
+        self.slot_seconds = slot_seconds
+        self.retention = retention_slots
+        n = len(self.zone_ids)
+        self.counters = np.zeros((retention_slots, n, len(COUNTERS)))
+        self.gauges = np.zeros((retention_slots, n, 2))  # Gauge values as of each slot's end
+        self.slots = np.full(retention_slots, -1, dtype=np.int64)  # Absolute slot held by each ring row
+        self.head = None  # Newest slot seen
+        self.in_trip = np.zeros(n)
+        self.surge = np.ones(n)
+        self.late_dropped = 0
+        self.unknown_zone = 0
+        self._zone_array = pa.array(self.zone_ids)
+        self._trip_types = pa.array(list(TRIP_COUNTERS))
+        self._trip_counters = np.array(list(TRIP_COUNTERS.values()))
+        self._second_key, self._second = None, None
+        self._flushed = {}  # window_seconds → start of the last window written to Parquet
+
+    def _slot_of(self, event_time):
+        # Parse once per distinct second; consecutive events mostly share it
+        key = event_time[:19]
+        if key != self._second_key:
+            self._second_key = key
+            self._second = int((datetime.fromisoformat(key) - EPOCH).total_seconds())
+        return self._second // self.slot_seconds
+
+    def _advance(self, slot):
+        # Recycle ring rows up to slot; each row is reset once per slot, so O(1) amortized
+        if self.head is not None and slot <= self.head:
+            return
+        start = slot if self.head is None else max(self.head + 1, slot - self.retention + 1)
+        slots = np.arange(start, slot + 1)
+        rows = slots % self.retention
+        self.counters[rows] = 0.0
+        self.gauges[rows, :, DRIVERS_IN_TRIP] = self.in_trip
+        self.gauges[rows, :, SURGE] = self.surge
+        self.slots[rows] = slots
+        self.head = slot
+
+    def observe(self, event_type, record):
+        # One trip or surge record (SimulatorEngine observer signature); pings are ignored
+        if event_type == "trip":
+            zone = self.index.get(record["pickup_zone_id"])
+            counter = TRIP_COUNTERS.get(record["event_type"])
+        elif event_type == "surge":
+            zone = self.index.get(record["zone_id"])
+            counter = SURGE_EVENTS
+        else:
+            return
+        if zone is None:
+            self.unknown_zone += 1
+            return
+        slot = self._slot_of(record["event_time"])
+        self._advance(slot)
+        if slot <= self.head - self.retention:
+            self.late_dropped += 1
+            return
+        row, head = slot % self.retention, self.head % self.retention
+        if counter == SURGE_EVENTS:
+            multiplier = record["surge_multiplier"]
+            self.counters[row, zone, SURGE_SUM] += multiplier
+            self.counters[row, zone, SURGE_EVENTS] += 1
+            self.surge[zone] = self.gauges[head, zone, SURGE] = multiplier
+            return
+        if counter is None:
+            return  # pickup: no KPI of its own
+        self.counters[row, zone, counter] += 1
+        if counter == MATCHES:
+            self.in_trip[zone] += 1
+        elif counter in (COMPLETIONS, CANCELS) and record.get("driver_id"):
+            self.in_trip[zone] -= 1  # The driver is released
+        else:
+            return
+        self.gauges[head, zone, DRIVERS_IN_TRIP] = self.in_trip[zone]
+
+    def observe_batch(self, event_type, batch):
+        # Vectorized observe() over a RecordBatch/Table in the TRIP_SCHEMA or SURGE_SCHEMA layout,
+        # in batch order: an event is late only against the head as of its own arrival
+        if event_type not in ("trip", "surge") or batch.num_rows == 0:
+            return
+        zone = batch.column("pickup_zone_id" if event_type == "trip" else "zone_id")
+        zone = pc.fill_null(pc.index_in(zone, value_set=self._zone_array), -1).to_numpy()
+        seconds = pc.strptime(pc.utf8_slice_codeunits(batch.column("event_time"), 0, 19),
+                              format="%Y-%m-%dT%H:%M:%S", unit="s")
+        slot = seconds.cast(pa.int64()).to_numpy() // self.slot_seconds
+        known = zone >= 0
+        self.unknown_zone += int((~known).sum())
+        if not known.any():
+            return
+        head_then = np.maximum.accumulate(np.where(known, slot, np.iinfo(np.int64).min))
+        if self.head is not None:
+            head_then = np.maximum(head_then, self.head)
+        keep = known & (slot > head_then - self.retention)
+        self.late_dropped += int((known & ~keep).sum())
+        if self.head is None:
+            self._advance(int(slot[known].min()))  # The ring starts at the oldest event of the first batch
+        self._advance(int(slot[known].max()))
+        if event_type == "surge":
+            multiplier = batch.column("surge_multiplier").to_numpy()[keep]
+            self._observe_surge(slot[keep], zone[keep], multiplier)
+            return
+        kind = pc.fill_null(pc.index_in(batch.column("event_type"), value_set=self._trip_types), -1).to_numpy()
+        keep &= kind >= 0
+        if not keep.any():
+            return
+        counter, slot, zone = self._trip_counters[kind[keep]], slot[keep], zone[keep]
+        # Events the batch itself pushed out of the ring are not counted, but still move the
+        # running driver count, from the oldest slot the ring holds
+        np.add.at(self.counters, (slot % self.retention, zone, counter), self._in_ring(slot))
+        slot = np.maximum(slot, self.head - self.retention + 1)
+        # Gauge rows from the oldest slot in the batch up to the head get the running driver count
+        has_driver = batch.column("driver_id").is_valid().to_numpy(zero_copy_only=False)[keep]
+        released = ((counter == COMPLETIONS) | (counter == CANCELS)) & has_driver
+        lo = int(slot.min())
+        delta = np.zeros((self.head - lo + 1, len(self.zone_ids)))
+        np.add.at(delta, (slot[counter == MATCHES] - lo, zone[counter == MATCHES]), 1)
+        np.add.at(delta, (slot[released] - lo, zone[released]), -1)
+        self.gauges[np.arange(lo, self.head + 1) % self.retention, :, DRIVERS_IN_TRIP] += np.cumsum(delta, axis=0)
+        self.in_trip += delta.sum(axis=0)
+
+    def _in_ring(self, slot):
+        # 1 for slots the ring still holds, 0 for ones already recycled
+        return (self.slots[slot % self.retention] == slot).astype(float)
+
+    def _observe_surge(self, slot, zone, multiplier):
+        if not len(slot):
+            return
+        held = self._in_ring(slot)
+        slot = np.maximum(slot, self.head - self.retention + 1)
+        np.add.at(self.counters, (slot % self.retention, zone, SURGE_SUM), multiplier * held)
+        np.add.at(self.counters, (slot % self.retention, zone, SURGE_EVENTS), held)
+        # Newest multiplier per (slot, zone), carried forward to the head
+        lo = int(slot.min())
+        rows = np.arange(lo, self.head + 1) % self.retention
+        latest = np.full((len(rows), len(self.zone_ids)), np.nan)
+        order = np.argsort(slot, kind="stable")
+        latest[slot[order] - lo, zone[order]] = multiplier[order]  # Repeated cells: the last assignment wins
+        since = np.maximum.accumulate(np.where(np.isnan(latest), -1, np.arange(len(rows))[:, None]), axis=0)
+        carried = latest[np.maximum(since, 0), np.arange(len(self.zone_ids))]
+        self.gauges[rows, :, SURGE] = np.where(since >= 0, carried, self.gauges[rows, :, SURGE])
+        self.surge = self.gauges[rows[-1], :, SURGE].copy()
+
+    def _window_slots(self, window_seconds):
+        if window_seconds <= 0 or window_seconds % self.slot_seconds:
+            raise ValueError(f"Window must be a positive multiple of {self.slot_seconds}s, got {window_seconds}")
+        return window_seconds // self.slot_seconds
+
+    def _live_slots(self, first):
+        # Absolute slots in [first, head] still held by the ring, with their rows
+        slots = np.arange(max(first, self.head - self.retention + 1), self.head + 1)
+        rows = slots % self.retention
+        live = self.slots[rows] == slots
+        return slots[live], rows[live]
+
+    def sliding(self, window_seconds, zones=None):
+        # The window_seconds ending with the newest slot
+        k = self._window_slots(window_seconds)
+        if self.head is None:
+            return KPI_SCHEMA.empty_table()
+        _, rows = self._live_slots(self.head - k + 1)
+        counters = self.counters[rows].sum(axis=0)[None]
+        gauges = self.gauges[self.head % self.retention][None]
+        start = (self.head - k + 1) * self.slot_seconds
+        return self._table(np.array([start]), window_seconds, counters, gauges, zones)
+
+    def _tumbling(self, k):
+        slots, rows = self._live_slots(self.head - self.retention + 1)
+        windows = slots // k
+        firsts = np.flatnonzero(np.r_[True, windows[1:] != windows[:-1]])
+        lasts = np.r_[firsts[1:], len(rows)] - 1
+        counters = np.add.reduceat(self.counters[rows], firsts, axis=0)
+        return windows[firsts] * k * self.slot_seconds, counters, self.gauges[rows[lasts]]
+
+    def tumbling(self, window_seconds, zones=None, last=None):
+        # Aligned windows in the ring, oldest first; the oldest may be partly expired
+        # and the newest may still be filling
+        k = self._window_slots(window_seconds)
+        if self.head is None:
+            return KPI_SCHEMA.empty_table()
+        starts, counters, gauges = self._tumbling(k)
+        if last:
+            starts, counters, gauges = starts[-last:], counters[-last:], gauges[-last:]
+        return self._table(starts, window_seconds, counters, gauges, zones)
+
+    def _table(self, starts, window_seconds, counters, gauges, zones=None):
+        z = np.arange(len(self.zone_ids)) if zones is None else np.array(
+            [self.index[zone_id] for zone_id in zones if zone_id in self.index], dtype=np.int64)
+        counters, gauges = counters[:, z], gauges[:, z]
+        completions, cancels = counters[..., COMPLETIONS], counters[..., CANCELS]
+        ended, surge_events = completions + cancels, counters[..., SURGE_EVENTS]
+        cancel_rate = np.where(ended > 0, cancels / np.maximum(ended, 1), np.nan)
+        avg_surge = np.where(surge_events > 0, counters[..., SURGE_SUM] / np.maximum(surge_events, 1),
+                             gauges[..., SURGE])
+        start = np.repeat(np.asarray(starts, dtype="datetime64[s]"), len(z))
+        return pa.table({
+            "window_start": start,
+            "window_end": start + np.timedelta64(window_seconds, "s"),
+            "zone_id": pa.array(self.zone_ids).take(np.tile(z, len(starts))),
+            "requests": counters[..., REQUESTS].ravel().astype(np.int64),
+            "matches": counters[..., MATCHES].ravel().astype(np.int64),
+            "completions": completions.ravel().astype(np.int64),
+            "cancels": cancels.ravel().astype(np.int64),
+            "cancel_rate": pa.array(cancel_rate.ravel(), from_pandas=True),  # NaN → null
+            "avg_surge": avg_surge.ravel().round(3),
+            "drivers_in_trip": gauges[..., DRIVERS_IN_TRIP].ravel().astype(np.int64),
+        }, schema=KPI_SCHEMA)
+
+    def flush_parquet(self, directory=KPI_DIR, window_seconds=None):
+        # Write tumbling windows that have closed since the last flush; returns the file or None
+        window_seconds = window_seconds or self.slot_seconds
+        k = self._window_slots(window_seconds)
+        if self.head is None:
+            return None
+        starts, counters, gauges = self._tumbling(k)
+        filling = (self.head // k) * k * self.slot_seconds
+        done = (starts < filling) & (starts > self._flushed.get(window_seconds, -1))
+        if not done.any():
+            return None
+        table = self._table(starts[done], window_seconds, counters[done], gauges[done])
+        first, last = (str(s).replace("-", "").replace(":", "") for s in starts[done][[0, -1]].astype("datetime64[s]"))
+        path = Path(directory) / f"kpis_{window_seconds}s_{first}_{last}.parquet"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, path, compression="snappy")
+        self._flushed[window_seconds] = int(starts[done][-1])
+        return path
+
+
+def to_records(table):
+    # JSON-ready rows with ISO timestamps like the events themselves
+    for name in ("window_start", "window_end"):
+        table = table.set_column(table.schema.get_field_index(name), name,
+                                 pc.strftime(table.column(name), format="%Y-%m-%dT%H:%M:%SZ"))
+    return table.to_pylist()
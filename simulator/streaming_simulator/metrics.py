@@ -0,0 +1,182 @@
+import functools
+import os
+from bisect import bisect_left
+from time import perf_counter
+
+# SIM_METRICS=0 turns instrumentation off: timed() then returns the function itself and
+# timer() a shared no-op, so the hot paths run exactly as uninstrumented code
+ENABLED = os.environ.get("SIM_METRICS", "1") != "0"
+# Latency buckets in seconds, from a single ping (~µs) to a whole bulk request
+LATENCY_BUCKETS = (1e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 0.1,
+                   0.25, 1.0, 5.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    # Monotonic count per label-value tuple. Updates are plain dict arithmetic: the
+    # simulator's hot paths run on one event-loop thread, so no lock is taken.
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        for labelvalues, value in sorted(self.values.items()):
+            yield self.name, _labels(self.labelnames, labelvalues), value
+
+
+class Gauge:
+    # Read at scrape time from a callback, so nothing is updated on the hot path.
+    # fn returns a number, a {label-value tuple: number} dict, or None to skip.
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labelnames=()):
+        self.name, self.help, self.fn, self.labelnames = name, help, fn, tuple(labelnames)
+
+    def samples(self):
+        value = self.fn()
+        if value is None:
+            return
+        items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        for labelvalues, v in items:
+            yield self.name, _labels(self.labelnames, labelvalues), v
+
+
+class CallbackCounter(Gauge):
+    # A monotonic total kept elsewhere (e.g. ShardedSimulator.handoffs), read at scrape time;
+    # typed counter so rate() applies
+    kind = "counter"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label-value tuple → [per-bucket counts (+Inf last), sum]
+
+    def observe(self, value, *labelvalues):
+        series = self.series.get(labelvalues)
+        if series is None:
+            series = self.series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labelvalues, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield (f"{self.name}_bucket", _labels(self.labelnames + ("le",), labelvalues + (le,)), cumulative)
+            yield f"{self.name}_sum", _labels(self.labelnames, labelvalues), total
+            yield f"{self.name}_count", _labels(self.labelnames, labelvalues), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        # Re-registering a name replaces it (e.g. gauges bound to a new engine)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        for metric in self.metrics.values():
+            samples = list(metric.samples())
+            if not samples and isinstance(metric, Gauge):
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {value}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def gauge(name, help, fn, labelnames=()):
+    return REGISTRY.register(Gauge(name, help, fn, labelnames))
+
+
+def callback_counter(name, help, fn, labelnames=()):
+    return REGISTRY.register(CallbackCounter(name, help, fn, labelnames))
+
+
+GENERATE_SECONDS = histogram("sim_generate_seconds", "Time to generate one event model", ["event_type"])
+BATCH_SECONDS = histogram("sim_generate_batch_seconds", "Time to generate one columnar batch", ["event_type"])
+EVENTS = counter("sim_events_total", "Events generated", ["event_type"])
+TRIP_TRANSITIONS = counter("sim_trip_transitions_total", "Trip lifecycle events emitted", ["event_type"])
+MATCH_SECONDS = histogram("sim_match_seconds", "Time to match a trip request to a driver")
+MATCHES = counter("sim_matches_total", "Trip requests by matching outcome", ["outcome"])
+SERIALIZE_SECONDS = histogram("sim_serialize_seconds", "Time to encode one response chunk or frame", ["format"])
+
+
+def timed(hist, *labelvalues):
+    # Decorator observing each call's latency; the function is returned untouched when disabled
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(perf_counter() - t0, *labelvalues)
+        return inner
+    return wrap
+
+
+class _Timer:
+    __slots__ = ("hist", "labelvalues", "t0")
+
+    def __init__(self, hist, labelvalues):
+        self.hist, self.labelvalues = hist, labelvalues
+
+    def __enter__(self):
+        self.t0 = perf_counter()
+
+    def __exit__(self, *exc):
+        self.hist.observe(perf_counter() - self.t0, *self.labelvalues)
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timer(hist, *labelvalues):
+    # with timer(SERIALIZE_SECONDS, "ndjson"): ... — for blocks that are not whole functions
+    return _Timer(hist, labelvalues) if ENABLED else _NO_TIMER
@@ -1,18 +1,28 @@
 from pydantic import BaseModel
-from datetime import datetime
 from typing import Optional, List, Tuple
+from .columnar import utc_now_iso
 
-class DriverLocationPing(BaseModel):
+class StampedEvent(BaseModel):
+    # Stamps timestamp at construction (a class-level default would be frozen at
+    # import time); event_time defaults to the same instant
+    def __init__(self, **data):
+        if data.get("timestamp") is None:
+            data["timestamp"] = utc_now_iso()
+        if data.get("event_time") is None:
+            data["event_time"] = data["timestamp"]
+        super().__init__(**data)
+
+class DriverLocationPing(StampedEvent):
     event_id: str
     driver_id: str
     vehicle_id: Optional[str]
     lat: float
     lng: float
     h3_index: str
-    timestamp: str = datetime.utcnow().isoformat() + "Z"
-    event_time: str = timestamp
+    timestamp: str
+    event_time: str
 
-class TripEvent(BaseModel):
+class TripEvent(StampedEvent):
     event_id: str
     trip_id: str
     event_type: str  # request, matched, pickup, dropoff, cancel
@@ -22,13 +32,17 @@ class TripEvent(BaseModel):
     dropoff_zone_id: str
     lat: Optional[float] = None
     lng: Optional[float] = None
-    timestamp: str = datetime.utcnow().isoformat() + "Z"
-    event_time: str = timestamp
+    timestamp: str
+    event_time: str
 
-class SurgeEvent(BaseModel):
+class SurgeEvent(StampedEvent):
     event_id: str
     zone_id: str
     surge_multiplier: float
     demand_score: float
-    timestamp: str = datetime.utcnow().isoformat() + "Z"
-    event_time: str = timestamp
\ No newline at end of file
+    timestamp: str
+    event_time: str
+
+def to_dict(event):
+    # pydantic v2 renamed .dict() to .model_dump()
+    return event.model_dump() if hasattr(event, "model_dump") else event.dict()
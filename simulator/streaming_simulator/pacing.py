@@ -0,0 +1,54 @@
+import asyncio
+import os
+import random
+import time
+
+# Defaults reproduce the old 0.2–1.0 s sleep per event (~1.7 events/sec)
+DEFAULT_RATE = float(os.environ.get("SIM_EVENTS_PER_SEC", 1 / 0.6))
+DEFAULT_BURST = int(os.environ.get("SIM_BURST", 1))
+DEFAULT_JITTER = float(os.environ.get("SIM_JITTER", 0.4 / 0.6))
+YIELD_EVERY = 1000  # Bulk mode still hands the loop back this often
+
+
+class Pacer:
+    # Token bucket on the event loop: refills at `rate` events/sec up to `burst`,
+    # and awaits asyncio.sleep instead of blocking the thread. rate=None is bulk
+    # mode (no pacing), for load tests.
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, jitter=DEFAULT_JITTER, rng=None):
+        if rate is not None and rate <= 0:
+            raise ValueError(f"rate must be > 0 (None for bulk mode), got {rate}")
+        if not 0 <= jitter <= 1:
+            raise ValueError(f"jitter must be in [0, 1], got {jitter}")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.jitter = jitter
+        self._random = rng or random.Random()
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._since_yield = 0
+
+    @classmethod
+    def bulk(cls):
+        return cls(rate=None)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def wait(self):
+        if not self.rate:
+            self._since_yield += 1
+            if self._since_yield >= YIELD_EVERY:
+                self._since_yield = 0
+                await asyncio.sleep(0)
+            return
+        self._refill()
+        if self._tokens < 1:
+            delay = (1 - self._tokens) / self.rate
+            if self.jitter:
+                delay *= self._random.uniform(1 - self.jitter, 1 + self.jitter)
+            await asyncio.sleep(delay)
+            self._refill()
+        # Early (jittered) wakeups leave a deficit, so the long-run rate still holds
+        self._tokens -= 1
@@ -0,0 +1,293 @@
+import gzip
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+import pyarrow as pa
+from .models import to_dict
+
+try:
+    import orjson
+except ImportError:  # Optional: faster JSON encoding
+    orjson = None
+
+# event_type → (topic, partition key field)
+TOPICS = {
+    "ping": ("driver_pings", "driver_id"),
+    "trip": ("trip_events", "trip_id"),
+    "surge": ("surge_events", "zone_id"),
+}
+
+
+def encode(record):
+    return orjson.dumps(record) if orjson else json.dumps(record, separators=(",", ":")).encode()
+
+
+class MemorySink:
+    # Keeps messages in RAM; for tests and broker-less throughput runs
+    def __init__(self, keep=True):
+        self.keep = keep
+        self.messages = {}
+
+    def write(self, topic, messages):
+        if self.keep:
+            self.messages.setdefault(topic, []).extend(messages)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    # One NDJSON file per topic (values only), optionally gzip-compressed
+    def __init__(self, directory, compression="gzip"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.compression = compression
+        self._files = {}
+
+    def _file(self, topic):
+        if topic not in self._files:
+            if self.compression == "gzip":
+                self._files[topic] = gzip.open(self.directory / f"{topic}.ndjson.gz", "ab", compresslevel=1)
+            else:
+                self._files[topic] = open(self.directory / f"{topic}.ndjson", "ab")
+        return self._files[topic]
+
+    def write(self, topic, messages):
+        self._file(topic).write(b"".join(value + b"\n" for _, value in messages))
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class ArrowSink:
+    # Arrow IPC stream per topic: one record batch of (key, value) per producer batch
+    SCHEMA = pa.schema([("key", pa.binary()), ("value", pa.binary())])
+
+    def __init__(self, directory, compression="lz4"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.options = pa.ipc.IpcWriteOptions(compression=compression)
+        self._writers = {}
+
+    def write(self, topic, messages):
+        if topic not in self._writers:
+            sink = pa.OSFile(str(self.directory / f"{topic}.arrows"), "wb")
+            self._writers[topic] = (sink, pa.ipc.new_stream(sink, self.SCHEMA, options=self.options))
+        keys, values = zip(*messages)
+        self._writers[topic][1].write_batch(
+            pa.record_batch([pa.array(keys, pa.binary()), pa.array(values, pa.binary())], schema=self.SCHEMA))
+
+    def flush(self):
+        for sink, _ in self._writers.values():
+            sink.flush()
+
+    def close(self):
+        for sink, writer in self._writers.values():
+            writer.close()
+            sink.close()
+        self._writers = {}
+
+
+class KafkaSink:
+    # kafka-python does its own batching and compression; keys pick the partition
+    # gzip: lz4 and snappy need codec packages that are not in requirements.txt
+    def __init__(self, bootstrap_servers="localhost:9092", compression="gzip", linger_ms=50,
+                 batch_size=256 * 1024, max_in_flight=5, **config):
+        from kafka import KafkaProducer  # Only needed when a broker is used
+        self.producer = KafkaProducer(
+            bootstrap_servers=bootstrap_servers,
+            compression_type=compression,
+            linger_ms=linger_ms,
+            batch_size=batch_size,
+            max_in_flight_requests_per_connection=max_in_flight,
+            **config
+        )
+
+    def write(self, topic, messages):
+        for key, value in messages:
+            self.producer.send(topic, key=key, value=value)
+
+    def flush(self):
+        self.producer.flush()
+
+    def close(self):
+        self.producer.close()
+
+
+class ProducerStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.messages = 0
+        self.bytes = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def record(self, messages):
+        size = sum(len(key) + len(value) for key, value in messages)
+        with self._lock:
+            self.messages += len(messages)
+            self.bytes += size
+            self.batches += 1
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "batches": self.batches,
+            "elapsed_s": round(elapsed, 3),
+            "messages_per_sec": round(self.messages / elapsed, 1),
+            "bytes_per_sec": round(self.bytes / elapsed, 1),
+        }
+
+
+class EventProducer:
+    # Pulls events from a SimulatorEngine, buffers keyed messages per topic, and hands
+    # full (or lingered) batches to a delivery thread. The hand-off queue holds at most
+    # max_in_flight batches: when the sink falls behind, produce() blocks (backpressure).
+    # A linger thread flushes buffers older than linger_ms, so a slow trickle of events
+    # is not held back until the next send.
+    def __init__(self, engine, sink, batch_size=1000, linger_ms=50, max_in_flight=8):
+        self.engine = engine
+        self.sink = sink
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.stats = ProducerStats()
+        self._buffers = {}  # topic → (first append time, [(key, value)])
+        self._queue = queue.Queue(maxsize=max_in_flight)
+        self._error = None
+        # Held from buffer pop to enqueue, so batches of a topic are queued in order
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+        self._worker = threading.Thread(target=self._deliver, daemon=True)
+        self._worker.start()
+        self._lingerer = threading.Thread(target=self._linger, daemon=True)
+        self._lingerer.start()
+
+    def _deliver(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                topic, messages = item
+                self.sink.write(topic, messages)
+                self.stats.record(messages)
+            except Exception as exc:  # Surfaced on the producing thread
+                self._error = exc
+            finally:
+                self._queue.task_done()
+
+    def _linger(self):
+        while not self._closing.wait(self.linger / 2):
+            now = time.monotonic()
+            for topic, (started, _) in list(self._buffers.items()):
+                if now - started >= self.linger:
+                    self._flush_topic(topic)
+
+    def _check(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Sink delivery failed") from error
+
+    def send(self, topic, key, value):
+        self._check()
+        with self._lock:
+            started, messages = self._buffers.setdefault(topic, (time.monotonic(), []))
+            messages.append((key, value))
+            full = len(messages) >= self.batch_size
+        if full:
+            self._flush_topic(topic)
+
+    def _flush_topic(self, topic):
+        with self._lock:
+            _, messages = self._buffers.pop(topic, (None, None))
+            if messages:
+                self._queue.put((topic, messages))  # Blocks while max_in_flight batches are pending
+
+    def _records(self, event_type, count):
+        if event_type == "ping":
+            # Batched columnar path, sliced so memory stays bounded by batch_size
+            remaining = count
+            while remaining > 0:
+                n = min(remaining, self.batch_size)
+                yield from self.engine.generate_pings_batch(n).to_pylist()
+                remaining -= n
+        else:
+            for _ in range(count):
+                event = self.engine.generate(event_type)
+                if event:
+                    yield to_dict(event)
+
+    def produce(self, event_type, count):
+        topic, key_field = TOPICS[event_type]
+        for record in self._records(event_type, count):
+            self.send(topic, str(record[key_field]).encode(), encode(record))
+        return self.stats.report()
+
+    def flush(self):
+        for topic in list(self._buffers):
+            self._flush_topic(topic)
+        self._queue.join()
+        self._check()
+        self.sink.flush()
+
+    def close(self):
+        self._closing.set()
+        self._lingerer.join()
+        self.flush()
+        self._queue.put(None)
+        self._worker.join()
+        self.sink.close()
+
+
+def make_sink(kind, path="producer_output", **config):
+    if kind == "kafka":
+        return KafkaSink(**config)
+    if kind == "file":
+        return FileSink(path, **config)
+    if kind == "arrow":
+        return ArrowSink(path, **config)
+    if kind == "memory":
+        return MemorySink(keep=False)
+    raise ValueError(f"Unknown sink: {kind}")
+
+
+if __name__ == "__main__":
+    import argparse
+    from .simulator_engine import SimulatorEngine
+    from .state_loader import load_state
+    from .replay import ReplayEngine
+
+    parser = argparse.ArgumentParser(description="Publish simulator events to a sink")
+    parser.add_argument("event_type", choices=sorted(TOPICS))
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--sink", choices=["memory", "file", "arrow", "kafka"], default="memory")
+    parser.add_argument("--path", default="producer_output")
+    parser.add_argument("--bootstrap-servers", default="localhost:9092")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--linger-ms", type=float, default=50)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--replay", metavar="LAKE", help="Publish trips replayed from a historical trips lake")
+    args = parser.parse_args()
+
+    config = {"bootstrap_servers": args.bootstrap_servers} if args.sink == "kafka" else {}
+    engine = SimulatorEngine(load_state())
+    if args.replay:
+        engine = ReplayEngine(engine, args.replay, loop=False)
+    producer = EventProducer(engine, make_sink(args.sink, args.path, **config),
+                             batch_size=args.batch_size, linger_ms=args.linger_ms, max_in_flight=args.max_in_flight)
+    producer.produce(args.event_type, args.count)
+    producer.close()
+    print(producer.stats.report())
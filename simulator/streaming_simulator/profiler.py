@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# The /debug/profile endpoints only exist with SIM_PROFILER=1; nothing samples until started
+PROFILER_ENABLED = os.environ.get("SIM_PROFILER", "0") == "1"
+DEFAULT_INTERVAL_MS = float(os.environ.get("SIM_PROFILER_INTERVAL_MS", 5))
+MAX_SECONDS = 300  # A forgotten profile stops itself
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    # A background thread snapshots every other thread's stack each interval and
+    # counts identical stacks. Output is the folded format ("root;...;leaf count"
+    # per line) that flamegraph.pl, speedscope and inferno read directly.
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._expired = False  # Hit max_seconds; stop() still hands over that profile once
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval_ms=DEFAULT_INTERVAL_MS, max_seconds=MAX_SECONDS):
+        if self.running:
+            raise RuntimeError("Profiler already running")
+        self.stacks, self.samples = Counter(), 0
+        self._expired = False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval_ms / 1000, max_seconds),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval, max_seconds):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + max_seconds
+        while not self._stop.wait(interval):
+            if time.monotonic() >= deadline:
+                # Stopped on its own: no longer running, so start() works again
+                self._expired = True
+                self._thread = None
+                return
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        # Returns the folded stacks collected since start()
+        thread = self._thread  # The sampler clears it when it expires
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+            self._thread = None
+        elif not self._expired:
+            raise RuntimeError("Profiler not running")
+        self._expired = False
+        return self.folded()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from .columnar import TRIP_SCHEMA, uuid4_array, repeat_string, utc_now_iso
+from .models import TripEvent
+from .pacing import Pacer
+from .metrics import ENABLED as METRICS_ENABLED, timed, timer, GENERATE_SECONDS, BATCH_SECONDS, EVENTS
+from .state_loader import DATA_DIR
+from .trip_scheduler import MEAN_STATE_SECONDS
+from .simulator_engine import batch_observer
+
+# Set SIM_REPLAY_PATH to a trips lake (e.g. data_samples/historical_trips) to replay it instead of simulating trips
+REPLAY_PATH = os.environ.get("SIM_REPLAY_PATH")
+DEFAULT_SPEEDUP = float(os.environ.get("SIM_REPLAY_SPEEDUP", 60))  # Event-time seconds per wall-clock second
+MAX_SPEEDUP = 10_000
+REPLAY_CACHE_DIR = DATA_DIR / ".replay_cache"
+READ_BATCH = 65_536  # Trips per memory-mapped record batch
+
+COLUMNS = ["trip_id", "driver_id", "rider_id", "pickup_zone_id", "dropoff_zone_id", "start_time",
+           "duration_minutes", "status"]
+EVENT_TYPES = pa.array(["request", "matched", "pickup", "dropoff", "cancel"])
+DROPOFF, CANCEL = 3, 4
+EVENT_ORDER = [("t", "ascending"), ("seq", "ascending")]
+
+
+def lake_partitions(lake_dir):
+    # year=YYYY/month=M directories in time order (as text, month=10 sorts before month=9)
+    keyed = [((int(p.parent.name.split("=")[1]), int(p.name.split("=")[1])), p)
+             for p in Path(lake_dir).glob("year=*/month=*")]
+    return [path for _, path in sorted(keyed)]
+
+
+def sorted_partition(path, cache_dir=REPLAY_CACHE_DIR):
+    # One month re-sorted by start_time into an Arrow IPC file, once per source version;
+    # replays memory-map it, so only the record batches in flight are resident
+    files = sorted(path.glob("*.parquet"))
+    digest = hashlib.sha256()
+    for f in files:
+        stat = f.stat()
+        digest.update(f"{f.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    prefix = f"{path.parent.name}_{path.name}_"
+    out = Path(cache_dir) / f"{prefix}{digest.hexdigest()[:16]}.arrow"
+    if out.exists():
+        return out
+    out.parent.mkdir(parents=True, exist_ok=True)
+    table = ds.dataset(files, format="parquet").to_table(columns=COLUMNS).sort_by("start_time")
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=READ_BATCH)
+    os.replace(tmp, out)
+    for stale in out.parent.glob(f"{prefix}*.arrow"):  # Sorts of older source files
+        if stale != out:
+            stale.unlink(missing_ok=True)
+    return out
+
+
+class ReplayEngine:
+    # Replays the historical trips lake as TripEvent lifecycles (request → matched →
+    # pickup → dropoff/cancel) in event_time order, speedup times faster than real
+    # time when paced. Month partitions are read as memory-mapped, start_time-sorted
+    # batches and merged through a small carry-over of in-flight trips, so memory is
+    # bounded by one batch plus the trips still running. Everything else (pings,
+    # surge, driver state) is the live engine's; replayed demand feeds its surge.
+    def __init__(self, live, lake_dir, speedup=DEFAULT_SPEEDUP, loop=True, seed=42, cache_dir=REPLAY_CACHE_DIR):
+        if not 1 <= speedup <= MAX_SPEEDUP:
+            raise ValueError(f"speedup must be between 1 and {MAX_SPEEDUP}, got {speedup}")
+        self.live = live
+        live.simulate_trips = False  # Surge run-ahead then only moves the live clock
+        self.speedup = speedup
+        self.loop = loop  # At the end, start over with event times shifted past the previous pass
+        self.seed = seed
+        self.cache_dir = cache_dir
+        self.partitions = lake_partitions(lake_dir)
+        if not self.partitions:
+            raise FileNotFoundError(f"No year=/month= partitions under {lake_dir}; run the batch generator first")
+        self._observers = []
+        self._offset = 0  # ms added to event times on the current pass
+        self._span = None  # ms from the first to one second past the last event of a pass
+        self._clock = None  # (event time, monotonic time) when paced replay started
+        self._start_pass(0)
+
+    def __getattr__(self, name):
+        if name == "live":  # Not set yet (e.g. while unpickling)
+            raise AttributeError(name)
+        return getattr(self.live, name)
+
+    def add_observer(self, observe, observe_batch=None):
+        self._observers.append(batch_observer(observe, observe_batch))
+        self.live.add_observer(observe, observe_batch)  # Surge events still come from the live engine
+
+    def _start_pass(self, n):
+        self._pass = n
+        self._rng = np.random.default_rng([self.seed, n])
+        self._batches = self._iter_trips()
+        self._trips_seen = 0
+        self._carry = None
+        self._block, self._times, self._pos = None, None, 0
+        self._first_t = self._last_t = None
+
+    def _iter_trips(self):
+        for path in self.partitions:
+            reader = pa.ipc.open_file(pa.memory_map(str(sorted_partition(path, self.cache_dir))))
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+    def _expand(self, batch):
+        # Four events per trip; waits before matching and pickup follow the live scheduler's means
+        n = batch.num_rows
+        start = batch.column("start_time").cast(pa.int64()).to_numpy()
+        to_match = self._rng.exponential(MEAN_STATE_SECONDS["requested"] * 1000, n)
+        to_pickup = to_match + self._rng.exponential(MEAN_STATE_SECONDS["matched"] * 1000, n)
+        ride = batch.column("duration_minutes").to_numpy() * 60_000
+        t = (start[:, None] + np.stack([np.zeros(n), to_match, to_pickup, to_pickup + ride], axis=1)).astype(np.int64)
+        kind = np.tile(np.arange(4, dtype=np.int8), n)
+        cancelled = pc.equal(batch.column("status"), "cancelled").to_numpy(zero_copy_only=False)
+        kind[3::4] = np.where(cancelled, CANCEL, DROPOFF)
+        trips = batch.select(["trip_id", "driver_id", "rider_id", "pickup_zone_id", "dropoff_zone_id"])
+        trips = trips.take(np.repeat(np.arange(n), 4))
+        requested = pa.array(kind == 0)
+        self._first_t = int(start[0]) if self._first_t is None else self._first_t
+        self._last_t = max(self._last_t or 0, int(t.max()))
+        seq = np.arange(self._trips_seen * 4, (self._trips_seen + n) * 4, dtype=np.int64)
+        self._trips_seen += n
+        return pa.table({
+            "t": t.ravel(),
+            "seq": seq,  # Tie-break: trip order, then lifecycle order
+            "kind": kind,
+            "event_id": uuid4_array(4 * n),
+            "trip_id": trips.column("trip_id"),
+            "driver_id": pc.if_else(requested, pa.nulls(4 * n, pa.string()), trips.column("driver_id")),
+            "rider_id": trips.column("rider_id"),
+            "pickup_zone_id": trips.column("pickup_zone_id"),
+            "dropoff_zone_id": trips.column("dropoff_zone_id"),
+        })
+
+    def _next_block(self):
+        # Events of the next trip batch (plus carry) before its last start_time are final:
+        # every later trip, and so every later event, starts at or after it
+        while True:
+            batch = next(self._batches, None)
+            if batch is None:
+                block, self._carry = self._carry, None
+                if block is not None and block.num_rows:
+                    return block
+                if not self.loop or not self._trips_seen:
+                    return None
+                self._span = self._span or self._last_t - self._first_t + 1000
+                self._offset += self._span
+                self._start_pass(self._pass + 1)
+                continue
+            if not batch.num_rows:
+                continue
+            events = self._expand(batch)
+            if self._carry is not None:
+                events = pa.concat_tables([self._carry, events])
+            events = events.sort_by(EVENT_ORDER)
+            watermark = batch.column("start_time").cast(pa.int64())[-1].as_py()
+            cut = int(np.searchsorted(events.column("t").to_numpy(), watermark, side="left"))
+            self._carry = events.slice(cut)
+            if cut:
+                return events.slice(0, cut)
+
+    def _ensure(self):
+        # Load the next block once the current one is used up; False at the end of a non-looping replay
+        while self._block is None or self._pos >= len(self._times):
+            block = self._next_block()
+            if block is None:
+                return False
+            block = block.combine_chunks()
+            self._times = block.column("t").to_numpy() + self._offset
+            if self._pass:  # Later passes get distinct trip ids
+                trip_ids = pc.binary_join_element_wise(block.column("trip_id"), f"-r{self._pass}", "")
+                block = block.set_column(block.schema.get_field_index("trip_id"), "trip_id", trip_ids)
+            self._block, self._pos = block, 0
+        return True
+
+    def _take(self, count):
+        # Up to count next events as one TRIP_SCHEMA batch
+        parts, times = [], []
+        while count > 0 and self._ensure():
+            n = min(count, len(self._times) - self._pos)
+            parts.append(self._block.slice(self._pos, n))
+            times.append(self._times[self._pos:self._pos + n])
+            self._pos += n
+            count -= n
+        if not parts:
+            return pa.RecordBatch.from_pylist([], schema=TRIP_SCHEMA)
+        events = pa.concat_tables(parts).combine_chunks()
+        n = events.num_rows
+        event_time = pc.strftime(pa.array(np.concatenate(times).astype("datetime64[ms]")),
+                                 format="%Y-%m-%dT%H:%M:%S")
+        timestamp = repeat_string(utc_now_iso(), n)
+        batch = pa.RecordBatch.from_arrays(
+            [
+                events.column("event_id").chunk(0),
+                events.column("trip_id").chunk(0),
+                EVENT_TYPES.take(events.column("kind").chunk(0)),
+                events.column("driver_id").chunk(0),
+                events.column("rider_id").chunk(0),
+                events.column("pickup_zone_id").chunk(0),
+                events.column("dropoff_zone_id").chunk(0),
+                pa.nulls(n, pa.float64()),
+                pa.nulls(n, pa.float64()),
+                timestamp,
+                pc.binary_join_element_wise(event_time, "Z", ""),
+            ],
+            schema=TRIP_SCHEMA,
+        )
+        # As in SimulatorEngine, every trip event adds demand to its pickup zone
+        self.live.surge.record_demand_batch(batch.column("pickup_zone_id"))
+        for observe_batch in self._observers:
+            observe_batch("trip", batch)
+        return batch
+
+    async def _due(self, limit):
+        # Sleep until the replay clock reaches the next event, then allow up to limit due events
+        while self._ensure():
+            now = time.monotonic()
+            if self._clock is None:
+                self._clock = (int(self._times[self._pos]), now)
+            t0, wall0 = self._clock
+            horizon = t0 + (now - wall0) * self.speedup * 1000
+            due = int(np.searchsorted(self._times, horizon, side="right")) - self._pos
+            if due > 0:
+                return min(due, limit)
+            await asyncio.sleep((self._times[self._pos] - horizon) / self.speedup / 1000)
+        return 0
+
+    def next_trip_record(self, timestamp=None):
+        records = self._take(1).to_pylist()
+        if not records:
+            return None
+        if timestamp:
+            records[0]["timestamp"] = timestamp
+        return records[0]
+
+    def generate(self, event_type: str):
+        if event_type != "trip":
+            return self.live.generate(event_type)
+        event = self.generate_trip_event()
+        if METRICS_ENABLED and event is not None:
+            EVENTS.inc("trip")
+        return event
+
+    @timed(GENERATE_SECONDS, "trip")
+    def generate_trip_event(self):
+        record = self.next_trip_record()
+        return TripEvent(**record) if record else None
+
+    def generate_batch(self, event_type: str, count: int):
+        if event_type != "trip":
+            return self.live.generate_batch(event_type, count)
+        with timer(BATCH_SECONDS, "trip"):
+            batch = self._take(count)
+        if METRICS_ENABLED:
+            EVENTS.inc("trip", amount=batch.num_rows)
+        return batch
+
+    def run_simulation(self, event_type: str, count: int = 1):
+        events = (self.generate(event_type) for _ in range(count))
+        return [event for event in events if event]
+
+    async def stream(self, event_type: str, count: Optional[int] = None, pacer: Optional[Pacer] = None):
+        # A paced pacer means "follow the replay clock"; its own rate is not used
+        if event_type != "trip":
+            async for event in self.live.stream(event_type, count, pacer):
+                yield event
+            return
+        pacer = pacer or Pacer()
+        emitted = 0
+        while count is None or emitted < count:
+            if pacer.rate:
+                if not await self._due(1):
+                    return
+            else:
+                await pacer.wait()
+            event = self.generate(event_type)
+            if event is None:
+                return
+            emitted += 1
+            yield event
+
+    async def stream_batches(self, event_type: str, count: Optional[int] = None, pacer: Optional[Pacer] = None,
+                             chunk_size: int = 1000):
+        # Paced: every event already due on the replay clock, up to chunk_size per batch
+        if event_type != "trip":
+            async for batch in self.live.stream_batches(event_type, count, pacer, chunk_size):
+                yield batch
+            return
+        pacer = pacer or Pacer()
+        remaining = count
+        while remaining is None or remaining > 0:
+            n = chunk_size if remaining is None else min(chunk_size, remaining)
+            if pacer.rate:
+                n = await self._due(n)
+            else:
+                await asyncio.sleep(0)  # Bulk mode still hands the loop back once per chunk
+            batch = self._take(n) if n else None
+            if batch is None or not batch.num_rows:
+                return
+            yield batch
+            if remaining is not None:
+                remaining -= batch.num_rows
+
+    async def run_simulation_async(self, event_type: str, count: int = 1, pacer: Optional[Pacer] = None):
+        return [event async for event in self.stream(event_type, count, pacer)]
@@ -0,0 +1,71 @@
+import json
+import pyarrow as pa
+from fastapi.responses import Response, StreamingResponse
+from .columnar import SCHEMAS
+from .metrics import timer, SERIALIZE_SECONDS
+
+try:
+    import orjson
+except ImportError:  # Optional: the fast paths fall back to the stdlib encoder
+    orjson = None
+
+# Bulk output formats for the /stream endpoints; "json" is the per-model default
+FORMATS = ("json", "orjson", "ndjson", "arrow")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+_ACCEPT = {
+    NDJSON_MEDIA_TYPE: "ndjson",
+    "application/jsonl": "ndjson",
+    ARROW_MEDIA_TYPE: "arrow",
+}
+_ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"  # IPC end-of-stream marker
+
+
+def negotiate(fmt=None, accept=None):
+    # An explicit ?format= wins over the Accept header
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+        return fmt
+    for part in (accept or "").split(","):
+        media_type = part.split(";")[0].strip()
+        if media_type in _ACCEPT:
+            return _ACCEPT[media_type]
+    return "json"
+
+
+def dumps(obj):
+    return orjson.dumps(obj) if orjson else json.dumps(obj, separators=(",", ":")).encode()
+
+
+async def _ndjson(batches):
+    async for batch in batches:
+        with timer(SERIALIZE_SECONDS, "ndjson"):
+            rows = batch.to_pylist()
+            chunk = b"".join(dumps(row) + b"\n" for row in rows)
+        if rows:
+            yield chunk
+
+
+async def _arrow(batches, schema):
+    # Schema message, one record batch message per chunk, then EOS: a valid IPC stream
+    yield schema.serialize().to_pybytes()
+    async for batch in batches:
+        with timer(SERIALIZE_SECONDS, "arrow"):
+            chunk = batch.serialize().to_pybytes()
+        yield chunk
+    yield _ARROW_EOS
+
+
+async def bulk_response(fmt, event_type, batches):
+    # batches: async iterator of pa.RecordBatch from SimulatorEngine.stream_batches
+    if fmt == "ndjson":
+        return StreamingResponse(_ndjson(batches), media_type=NDJSON_MEDIA_TYPE)
+    if fmt == "arrow":
+        return StreamingResponse(_arrow(batches, SCHEMAS[event_type]), media_type=ARROW_MEDIA_TYPE)
+    records = []
+    async for batch in batches:
+        records.extend(batch.to_pylist())
+    with timer(SERIALIZE_SECONDS, fmt):
+        body = dumps(records)
+    return Response(body, media_type="application/json")
@@ -0,0 +1,217 @@
+import asyncio
+import multiprocessing as mp
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import h3
+import pyarrow as pa
+from .columnar import SCHEMAS
+from .metrics import ENABLED as METRICS_ENABLED, timer, BATCH_SECONDS, EVENTS
+from .models import DriverLocationPing, TripEvent, SurgeEvent
+from .simulator_engine import SimulatorEngine, MAX_PENDING_TRIPS, batch_observer
+from .state_loader import load_state
+
+SHARDS = int(os.environ.get("SIM_SHARDS", 1))  # >1 runs the simulator as that many worker processes
+SHARD_RESOLUTION = 5  # Zones are assigned to shards a whole H3 res-5 parent (~250 km²) at a time
+EPOCH_SECONDS = float(os.environ.get("SIM_SHARD_EPOCH", 60))  # Virtual seconds all shards advance per step
+MODELS = {"ping": DriverLocationPing, "trip": TripEvent, "surge": SurgeEvent}
+
+
+def partition_zones(zones, n_shards, resolution=SHARD_RESOLUTION):
+    # zone_id → shard. Largest parent cells first, each to the least-loaded shard,
+    # so neighboring zones (and the drivers based in them) mostly share a shard
+    groups = {}
+    for z in zones:
+        groups.setdefault(h3.cell_to_parent(z["h3_index"], resolution), []).append(z["zone_id"])
+    loads, owner = [0] * n_shards, {}
+    for _, zone_ids in sorted(groups.items(), key=lambda kv: (-len(kv[1]), kv[0])):
+        k = loads.index(min(loads))
+        loads[k] += len(zone_ids)
+        owner.update((zone_id, k) for zone_id in zone_ids)
+    return owner
+
+
+def shard_state(state, owner, shard_id):
+    # Drivers belong to the shard owning their home zone; zones and riders stay city-wide
+    zone_of_cell = {z["h3_index"]: z["zone_id"] for z in state["zones"]}
+    table = state["driver_table"]
+    mine = pa.array([owner[zone_of_cell[c]] == shard_id for c in table["h3_index"].to_pylist()])
+    drivers = table.filter(mine)
+    return {**state, "drivers": drivers["driver_id"].to_pylist(), "driver_table": drivers}
+
+
+def _ipc(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _shard_main(conn, shard_id, n_shards, owner, request_rate, seed, start):
+    # Worker process: owns its drivers outright and answers one step per message
+    state = load_state()  # Memory-mapped snapshot, so shards share the pages
+    pickup_zone_ids = [z["zone_id"] for z in state["zones"] if owner[z["zone_id"]] == shard_id]
+    outbox = []
+
+    def handoff(trip_id, trip):
+        # No driver within reach: pass the request to the next shard; the last one falls back
+        hops = trip.get("hops", 0)
+        if hops >= n_shards - 1:
+            return False
+        trip["hops"] = hops + 1
+        outbox.append(((shard_id + 1) % n_shards, trip_id, trip))
+        return True
+
+    if request_rate is not None:  # A city-wide rate, split by zone share; None sizes each shard to its own fleet
+        request_rate = request_rate * len(pickup_zone_ids) / len(owner)
+    engine = SimulatorEngine(shard_state(state, owner, shard_id), request_rate=request_rate, seed=seed + shard_id,
+                             pickup_zone_ids=pickup_zone_ids, trip_id_prefix=f"T{shard_id:02d}-", handoff=handoff)
+    engine.scheduler.clock.start = start  # One virtual timeline across shards
+    conn.send(len(engine.drivers.driver_ids))
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        kind, arg, inbox = message
+        if kind == "trip":
+            # Every event due by virtual time arg; adopted requests are scheduled after the last step
+            since, until = arg
+            engine.scheduler.clock.advance_to(since)
+            for trip_id, trip in inbox:
+                engine.adopt(trip_id, trip)
+            records, times = engine.trip_records_until(until)
+            table = pa.Table.from_pylist(records, schema=SCHEMAS["trip"]).append_column("_t", pa.array(times, pa.float64()))
+        elif kind == "ping":
+            table = pa.Table.from_batches([engine.generate_pings_batch(arg)])
+        else:
+            table = pa.Table.from_pylist(engine.drain_surge(), schema=SCHEMAS["surge"])
+        conn.send((_ipc(table), outbox))
+        outbox = []
+
+
+class ShardedSimulator:
+    # SimulatorEngine split across worker processes by zone. Each shard exclusively
+    # owns the drivers based in its zones, so no driver is ever matched twice; a
+    # request no local driver can reach is handed to the next shard over the pipes.
+    # Shards advance through virtual time in lockstep epochs, generating in parallel,
+    # and each epoch is merged in event-time order, so the output is one ordered stream.
+    def __init__(self, n_shards=SHARDS, request_rate=None, epoch_seconds=EPOCH_SECONDS, seed=42, state=None):
+        state = state or load_state()
+        self.zone_ids = [z["zone_id"] for z in state["zones"]]
+        self.n_shards = n_shards
+        self.epoch = epoch_seconds
+        self.until = 0.0  # Virtual seconds every shard has generated up to
+        self.handoffs = 0
+        self._inboxes = [[] for _ in range(n_shards)]
+        self._pending = {event_type: schema.empty_table() for event_type, schema in SCHEMAS.items()}
+        self._observers = []
+        self._executor = ThreadPoolExecutor(1)  # Waits on the shards off the event loop, one step at a time
+        owner = partition_zones(state["zones"], n_shards)
+        start = datetime.utcnow()
+        ctx = mp.get_context("spawn")  # No forked copies of the parent's threads or event loop
+        self._conns, self._procs = [], []
+        for k in range(n_shards):
+            conn, child = ctx.Pipe()
+            proc = ctx.Process(target=_shard_main, args=(child, k, n_shards, owner, request_rate, seed, start),
+                               daemon=True)
+            proc.start()
+            child.close()
+            self._conns.append(conn)
+            self._procs.append(proc)
+        self.driver_counts = [conn.recv() for conn in self._conns]
+
+    def add_observer(self, observe, observe_batch=None):
+        self._observers.append(batch_observer(observe, observe_batch))
+
+    def _step(self, kind, args):
+        # Send to every shard first so they all work in parallel, then gather in shard order
+        for k, conn in enumerate(self._conns):
+            conn.send((kind, args[k], self._inboxes[k]))
+        self._inboxes = [[] for _ in range(self.n_shards)]
+        tables = []
+        for conn in self._conns:
+            payload, outbox = conn.recv()
+            tables.append(pa.ipc.open_stream(payload).read_all())
+            for target, trip_id, trip in outbox:
+                self._inboxes[target].append((trip_id, trip))
+                self.handoffs += 1
+        return pa.concat_tables(tables)
+
+    def _refill(self, event_type, count):
+        if event_type == "trip":
+            since, self.until = self.until, self.until + self.epoch
+            merged = self._step("trip", [(since, self.until)] * self.n_shards)
+            # Stable sort: ties keep shard order, so output is deterministic for a shard count
+            return merged.sort_by("_t").drop_columns(["_t"])
+        if event_type == "ping":
+            # Split by each shard's share of the fleet
+            total = sum(self.driver_counts)
+            shares = [count * n // total for n in self.driver_counts]
+            shares[-1] += count - sum(shares)
+            return self._step("ping", shares)
+        fresh = self._step("surge", [None] * self.n_shards)
+        if not fresh.num_rows:
+            # No tick due on the shards' virtual clocks: run them all one epoch ahead, in
+            # lockstep, and keep that epoch's trip events for the trip stream
+            trips = pa.concat_tables([self._pending["trip"], self._refill("trip", 0)])
+            self._pending["trip"] = trips.slice(max(trips.num_rows - MAX_PENDING_TRIPS, 0))
+            fresh = self._step("surge", [None] * self.n_shards)
+        return fresh
+
+    def _take(self, event_type, count):
+        # Up to count events from the shards; blocks on the pipes
+        if event_type not in MODELS:
+            raise ValueError(f"Unknown event type: {event_type}")
+        pending = self._pending[event_type]
+        with timer(BATCH_SECONDS, event_type):  # Includes waiting on the shards
+            while pending.num_rows < count:
+                fresh = self._refill(event_type, count - pending.num_rows)
+                if not fresh.num_rows and event_type != "trip":
+                    break  # No active drivers / no surge changes: return what there is, like SimulatorEngine
+                pending = pa.concat_tables([pending, fresh])
+        batch, self._pending[event_type] = pending.slice(0, count), pending.slice(count)
+        batch = batch.combine_chunks()
+        return batch.to_batches()[0] if batch.num_rows else pa.RecordBatch.from_pylist([], schema=SCHEMAS[event_type])
+
+    def _emit(self, event_type, batch):
+        if METRICS_ENABLED:
+            EVENTS.inc(event_type, amount=batch.num_rows)
+        if event_type != "ping":
+            for observe_batch in self._observers:
+                observe_batch(event_type, batch)
+        return batch
+
+    def generate_batch(self, event_type: str, count: int):
+        return self._emit(event_type, self._take(event_type, count))
+
+    async def _generate_batch_async(self, event_type, count):
+        # Only the pipe round trips leave the loop; observers (e.g. the app's KPIs) stay on it
+        batch = await asyncio.get_running_loop().run_in_executor(self._executor, self._take, event_type, count)
+        return self._emit(event_type, batch)
+
+    @staticmethod
+    def _model(event_type, batch):
+        records = batch.to_pylist()
+        return MODELS[event_type](**records[0]) if records else None
+
+    def generate_pings_batch(self, n: int):
+        return self.generate_batch("ping", n)
+
+    def generate(self, event_type: str):
+        return self._model(event_type, self.generate_batch(event_type, 1))
+
+    async def _generate_async(self, event_type):
+        return self._model(event_type, await self._generate_batch_async(event_type, 1))
+
+    # Pacing and streaming only go through generate()/generate_batch() and their async forms
+    run_simulation = SimulatorEngine.run_simulation
+    stream = SimulatorEngine.stream
+    stream_batches = SimulatorEngine.stream_batches
+    run_simulation_async = SimulatorEngine.run_simulation_async
+
+    def close(self):
+        self._executor.shutdown()
+        for conn in self._conns:
+            conn.send(None)
+        for proc in self._procs:
+            proc.join()
@@ -1,134 +1,393 @@
+import time
 import uuid
 import random
-import time
+import itertools
+from collections import deque
 from datetime import datetime
-import h3
+from typing import Optional
+import numpy as np
+import pyarrow as pa
 from faker import Faker
 from .models import DriverLocationPing, TripEvent, SurgeEvent
+from .driver_store import DriverStore, ACTIVE, IN_TRIP
+from .spatial_index import AvailableDriverIndex
+from .trip_scheduler import TripScheduler, REQUEST, default_request_rate
+from .surge_engine import SurgeEngine
+from .columnar import uuid4_array, repeat_string, utc_now_iso, PING_SCHEMA, TRIP_SCHEMA, SURGE_SCHEMA
+from .pacing import Pacer
+from .metrics import (ENABLED as METRICS_ENABLED, timed, timer, GENERATE_SECONDS, BATCH_SECONDS, EVENTS,
+                      TRIP_TRANSITIONS, MATCH_SECONDS, MATCHES)
 
 fake = Faker()
 random.seed(42)  # Consistent with batch
+MAX_PENDING_TRIPS = 100_000  # Trip events run ahead for surge but not yet read; the oldest drop beyond this
+
+def batch_observer(observe, observe_batch=None):
+    # Bulk paths notify once per batch: observe_batch takes the batch whole, else observe gets each record
+    if observe_batch is not None:
+        return observe_batch
+
+    def each(event_type, batch):
+        for record in batch.to_pylist():
+            observe(event_type, record)
+    return each
+
 
 class SimulatorEngine:
-    def __init__(self, state):
+    def __init__(self, state, trip_mode="discrete", request_rate=None, seed=42, pickup_zone_ids=None,
+                 trip_id_prefix="T", handoff=None):
         self.state = state
-        self.active_trips = {}  # trip_id: {"state": "requested", "events": [], ...}
-        self.zone_demand = {z["zone_id"]: 1.0 for z in self.state["zones"]}  # Baseline
+        self.zone_ids = [z["zone_id"] for z in self.state["zones"]]
+        # Requests (and surge) only for these zones; a shard of ShardedSimulator owns a subset
+        self.pickup_zone_ids = list(pickup_zone_ids) if pickup_zone_ids is not None else self.zone_ids
+        self.drivers = DriverStore(state["driver_table"])  # Columnar driver state
+        self.rng = np.random.default_rng(seed)
+        self._random = random.Random(seed)
+        self.available = AvailableDriverIndex(self.drivers)  # Available drivers by H3 cell
+        self.zone_cells = {z["zone_id"]: self.drivers.cells.intern(z["h3_index"]) for z in self.state["zones"]}
+        self.active_trips = {}  # trip_id: {"state": "requested", "driver_id": ..., ...}
+        self._trip_ids = itertools.count(1_000_001)
+        self.trip_id_prefix = trip_id_prefix
+        # handoff(trip_id, trip) → True if another shard takes a request no local driver can reach
+        self.handoff = handoff
+        # "discrete": scheduled lifecycles on a virtual clock; "random": legacy random advance
+        self.trip_mode = trip_mode
+        if request_rate is None:  # Requests per virtual second, sized to the active fleet
+            request_rate = default_request_rate(int(np.count_nonzero(self.drivers.status == ACTIVE)))
+        self.scheduler = TripScheduler(self.rng, request_rate)
+        owned = set(self.pickup_zone_ids)
+        # Demand, ticked in bulk: on the virtual clock in discrete mode, so surge keeps sim time with trips
+        clock = (lambda: self.scheduler.clock.t) if trip_mode == "discrete" else time.monotonic
+        self.surge = SurgeEngine([z for z in self.state["zones"] if z["zone_id"] in owned],
+                                 rng=np.random.default_rng(seed + 1), clock=clock)
+        self._pending_surge = deque()
+        self._pending_trips = deque(maxlen=MAX_PENDING_TRIPS)  # (record, virtual time) from surge run-ahead
+        self.simulate_trips = True  # False when another source (e.g. ReplayEngine) supplies trips and their demand
+        self._observers = []  # Callables (event_type, record) fed every trip/surge record
+
+    def add_observer(self, observe, observe_batch=None):
+        # In-process consumers (e.g. KpiAggregator) see every emitted trip/surge record. Records are
+        # built one at a time here, so only observe is used; bulk engines also take observe_batch
+        self._observers.append(observe)
 
+    def _notify(self, event_type, record):
+        for observe in self._observers:
+            observe(event_type, record)
+        return record
+
+    @timed(GENERATE_SECONDS, "ping")
     def generate_ping(self, driver_id: str):
-        driver_state = self.state["driver_states"][driver_id]
-        if driver_state["status"] != "active":
+        i = self.drivers.index[driver_id]
+        if self.drivers.status[i] != ACTIVE:
             return None  # Only active drivers ping
 
-        # Simulate movement: random walk to neighbor H3 cell
-        current_h3 = driver_state["h3_index"]
-        neighbors = list(h3.grid_disk(current_h3, 1))  # Adjacent cells (v4 API)
-        new_h3 = random.choice(neighbors) if neighbors else current_h3
-        (new_lat, new_lng) = h3.cell_to_latlng(new_h3)
-
-        # Update state
-        driver_state["current_lat"] = new_lat
-        driver_state["current_lng"] = new_lng
-        driver_state["h3_index"] = new_h3
+        # Simulate movement: random walk to neighbor H3 cell (cached adjacency)
+        self.drivers.step(np.array([i]), self.rng)
+        self.available.add(i)
+        driver_state = self.drivers.get(driver_id)
 
         return DriverLocationPing(
             event_id=str(uuid.uuid4()),
             driver_id=driver_id,
             vehicle_id=driver_state["vehicle_id"],
-            lat=new_lat,
-            lng=new_lng,
-            h3_index=new_h3
+            lat=driver_state["current_lat"],
+            lng=driver_state["current_lng"],
+            h3_index=driver_state["h3_index"]
         )
 
+    def generate_pings_batch(self, n: int):
+        # Advance n random-walk moves across active drivers in one vectorized pass;
+        # returns a pa.RecordBatch with the DriverLocationPing fields as columns
+        idx, cells = self.drivers.walk(n, self.rng)
+        self.available.invalidate()
+        timestamp = repeat_string(utc_now_iso(), len(idx))  # One timestamp per batch
+        return pa.RecordBatch.from_arrays(
+            [
+                uuid4_array(len(idx)),
+                self.drivers.driver_ids.take(idx),
+                self.drivers.vehicle_ids.take(idx),
+                pa.array(self.drivers.cells.lat[cells]),
+                pa.array(self.drivers.cells.lng[cells]),
+                self.drivers.cells.as_arrow().take(cells),
+                timestamp,
+                timestamp,
+            ],
+            schema=PING_SCHEMA,
+        )
+
+    def _new_trip(self):
+        trip_id = f"{self.trip_id_prefix}{next(self._trip_ids):07d}"  # Sequential, so live trips never collide
+        self.active_trips[trip_id] = {
+            "state": "requested",
+            "rider_id": self._random.choice(self.state["riders"]),
+            "pickup_zone_id": self._random.choice(self.pickup_zone_ids),
+            "dropoff_zone_id": self._random.choice(self.zone_ids),
+            "driver_id": None
+        }
+        return trip_id, self.active_trips[trip_id]
+
+    def _advance_trip(self, trip_id, trip):
+        # Apply the next lifecycle transition; returns its event type
+        if trip["state"] == "requested":
+            return self._match(trip_id, trip)
+        if trip["state"] == "matched":
+            trip["state"] = "pickup"
+            return "pickup"
+        del self.active_trips[trip_id]
+        self._release_driver(trip["driver_id"])
+        if self._random.random() < 0.15:  # Cancel rate
+            return "cancel"
+        trip["state"] = "dropoff"
+        return "dropoff"
+
+    @timed(MATCH_SECONDS)
+    def _match(self, trip_id, trip):
+        # Match to nearest available driver, searching rings out from the pickup cell
+        cell = self.zone_cells[trip["pickup_zone_id"]]
+        i = self.available.nearest(cell, self.rng, fallback=self.handoff is None)
+        if i is None and self.handoff is not None:
+            if self.handoff(trip_id, trip):
+                del self.active_trips[trip_id]
+                if METRICS_ENABLED:
+                    MATCHES.inc("handoff")
+                return None  # Another shard continues the trip; nothing to emit here
+            i = self.available.nearest(cell, self.rng)
+        if i is None:
+            # No drivers available; mark as cancelled
+            del self.active_trips[trip_id]
+            if METRICS_ENABLED:
+                MATCHES.inc("no_driver")
+            return "cancel"
+        trip["driver_id"] = self.drivers.driver_ids[i].as_py()
+        self.drivers.status[i] = IN_TRIP
+        trip["state"] = "matched"
+        if METRICS_ENABLED:
+            MATCHES.inc("matched")
+        return "matched"
+
+    def _trip_record(self, trip_id, trip, event_type, event_time, timestamp):
+        # Update demand for surge sim
+        self.surge.record_demand(trip["pickup_zone_id"])
+        if METRICS_ENABLED:
+            TRIP_TRANSITIONS.inc(event_type)
+
+        return {
+            "event_id": str(uuid.uuid4()),
+            "trip_id": trip_id,
+            "event_type": event_type,
+            "driver_id": trip.get("driver_id"),
+            "rider_id": trip["rider_id"],
+            "pickup_zone_id": trip["pickup_zone_id"],
+            "dropoff_zone_id": trip["dropoff_zone_id"],
+            "lat": None,
+            "lng": None,
+            "timestamp": timestamp or utc_now_iso(),
+            "event_time": event_time
+        }
+
+    @timed(GENERATE_SECONDS, "trip")
     def generate_trip_event(self):
-        # Simulate new trip or advance existing
-        if random.random() < 0.3 or not self.active_trips:  # 30% chance new trip
-            trip_id = f"T{str(random.randint(1000000, 9999999)).zfill(7)}"  # New unique
-            rider_id = random.choice(self.state["riders"])
-            pickup_zone_id = random.choice([z["zone_id"] for z in self.state["zones"]])
-            dropoff_zone_id = random.choice([z["zone_id"] for z in self.state["zones"]])
-            self.active_trips[trip_id] = {
-                "state": "requested",
-                "rider_id": rider_id,
-                "pickup_zone_id": pickup_zone_id,
-                "dropoff_zone_id": dropoff_zone_id,
-                "driver_id": None,
-                "events": []
-            }
-            trip = self.active_trips[trip_id]
+        return TripEvent(**self.next_trip_record())
+
+    def next_trip_record(self, timestamp=None):
+        # TripEvent fields as a plain dict; the bulk paths skip model construction
+        if self.trip_mode == "random":
+            return self._random_trip_record(timestamp)
+        # Discrete-event mode: events already run ahead for surge, then the next due transition
+        if self._pending_trips:
+            record, _ = self._pending_trips.popleft()
+            if timestamp:
+                record["timestamp"] = timestamp
+            return record
+        event_type = None
+        while event_type is None:  # A handed-off request emits nothing here
+            trip_id, trip, event_type = self._pop_transition()
+        return self._emit_transition(trip_id, trip, event_type, timestamp)
+
+    def _pop_transition(self):
+        trip_id = self.scheduler.pop()
+        if trip_id is REQUEST:
+            self.scheduler.schedule_request()
+            trip_id, trip = self._new_trip()
+            return trip_id, trip, "request"
+        trip = self.active_trips[trip_id]
+        return trip_id, trip, self._advance_trip(trip_id, trip)
+
+    def _emit_transition(self, trip_id, trip, event_type, timestamp=None):
+        if trip_id in self.active_trips:
+            self.scheduler.schedule(trip_id, trip["state"])
+        return self._notify("trip", self._trip_record(trip_id, trip, event_type, self.scheduler.clock.iso(), timestamp))
+
+    def _simulate_until(self, t):
+        # (record, virtual time) for every trip event due by virtual second t
+        emitted = []
+        while self.scheduler.peek() <= t:
+            trip_id, trip, event_type = self._pop_transition()
+            if event_type is not None:
+                emitted.append((self._emit_transition(trip_id, trip, event_type), self.scheduler.clock.t))
+        return emitted
+
+    def trip_records_until(self, t):
+        # Every trip event due by virtual second t, with the virtual time of each
+        emitted = list(self._pending_trips) + self._simulate_until(t)
+        self._pending_trips.clear()
+        return [record for record, _ in emitted], [event_t for _, event_t in emitted]
+
+    def adopt(self, trip_id, trip):
+        # A request handed over by another shard; matching is tried here next
+        self.active_trips[trip_id] = trip
+        self.scheduler.schedule(trip_id, trip["state"])
+
+    def _random_trip_record(self, timestamp):
+        # Legacy mode: new trip or advance a random active trip, in wall-clock time
+        if self._random.random() < 0.3 or not self.active_trips:  # 30% chance new trip
+            trip_id, trip = self._new_trip()
             event_type = "request"
         else:
-            # Advance random active trip
-            trip_id = random.choice(list(self.active_trips.keys()))
+            trip_id = self._random.choice(list(self.active_trips.keys()))
             trip = self.active_trips[trip_id]
-            if trip["state"] == "requested":
-                # Match to driver
-                available_drivers = [d for d, s in self.state["driver_states"].items() if s["status"] == "active"]
-                if available_drivers:
-                    driver_id = random.choice(available_drivers)
-                    trip["driver_id"] = driver_id
-                    self.state["driver_states"][driver_id]["status"] = "in_trip"
-                    event_type = "matched"
-                    trip["state"] = "matched"
-                else:
-                    # No drivers available; mark as cancelled
-                    event_type = "cancel"
-                    del self.active_trips[trip_id]
-            elif trip["state"] == "matched":
-                event_type = "pickup"
-                trip["state"] = "pickup"
-            elif trip["state"] == "pickup":
-                if random.random() < 0.15:  # Cancel rate
-                    event_type = "cancel"
-                    del self.active_trips[trip_id]
-                    if trip["driver_id"]:
-                        self.state["driver_states"][trip["driver_id"]]["status"] = "active"
-                else:
-                    event_type = "dropoff"
-                    trip["state"] = "dropoff"
-                    del self.active_trips[trip_id]
-                    if trip["driver_id"]:
-                        self.state["driver_states"][trip["driver_id"]]["status"] = "active"
-            else:
-                return None
+            event_type = self._advance_trip(trip_id, trip)
+        return self._notify("trip", self._trip_record(trip_id, trip, event_type, utc_now_iso(), timestamp))
 
-        # Update demand for surge sim
-        self.zone_demand[trip["pickup_zone_id"]] += 0.1  # Increment demand
+    def _release_driver(self, driver_id):
+        if driver_id:
+            i = self.drivers.index[driver_id]
+            self.drivers.status[i] = ACTIVE
+            self.available.add(i)
 
-        return TripEvent(
-            event_id=str(uuid.uuid4()),
-            trip_id=trip_id,
-            event_type=event_type,
-            driver_id=trip.get("driver_id"),
-            rider_id=trip["rider_id"],
-            pickup_zone_id=trip["pickup_zone_id"],
-            dropoff_zone_id=trip["dropoff_zone_id"]
-        )
+    def surge_tick(self):
+        # Runs the surge steps due by the surge clock; queues events for zones whose multiplier changed
+        now = utc_now_iso()
+        queued = 0
+        for t, (changed, multipliers, demand) in self.surge.advance():
+            event_time = self.scheduler.clock.iso(t) if self.trip_mode == "discrete" else now
+            self._pending_surge.extend(
+                {
+                    "event_id": str(uuid.uuid4()),
+                    "zone_id": self.surge.zone_ids[i],
+                    "surge_multiplier": m,
+                    "demand_score": d,
+                    "timestamp": now,
+                    "event_time": event_time
+                }
+                for i, m, d in zip(changed.tolist(), multipliers.tolist(), demand.tolist())
+            )
+            queued += len(changed)
+        return queued
 
+    @timed(GENERATE_SECONDS, "surge")
     def generate_surge_event(self):
-        zone_id = random.choice([z["zone_id"] for z in self.state["zones"]])
-        demand = self.zone_demand[zone_id]
-        surge = 1.0 if demand < 1.5 else random.uniform(1.2, 3.0)
-        # Decay demand over time
-        self.zone_demand[zone_id] = max(1.0, demand * 0.99)
-        return SurgeEvent(
-            event_id=str(uuid.uuid4()),
-            zone_id=zone_id,
-            surge_multiplier=surge,
-            demand_score=demand
-        )
+        record = self.next_surge_record()
+        return SurgeEvent(**record) if record else None
+
+    def drain_surge(self):
+        # Runs the due ticks and hands over every queued surge record, unobserved, to a caller
+        # that batches and observes them itself (a ShardedSimulator shard)
+        self.surge_tick()
+        records = list(self._pending_surge)
+        self._pending_surge.clear()
+        return records
+
+    def run_to_next_surge_tick(self):
+        # Discrete mode: runs the simulation ahead to the next surge tick, so surge flows without
+        # a trip stream moving the virtual clock; the trip events on the way wait for next_trip_record
+        t = self.surge.next_tick
+        if self.simulate_trips:
+            self._pending_trips.extend(self._simulate_until(t))
+        self.scheduler.clock.advance_to(t)
+        return self.surge_tick()
+
+    def next_surge_record(self, timestamp=None):
+        # Drain queued changes first, then run the due ticks. With none due, discrete mode runs
+        # ahead one tick and random mode waits on wall time; None when that tick changed nothing
+        if not self._pending_surge and not self.surge_tick() and self.trip_mode == "discrete":
+            self.run_to_next_surge_tick()
+        if not self._pending_surge:
+            return None
+        record = self._pending_surge.popleft()
+        if timestamp:
+            record["timestamp"] = timestamp
+        return self._notify("surge", record)
+
+    def generate(self, event_type: str):
+        if event_type == "ping":
+            # A random active driver, like generate_pings_batch: one ping per call while any driver is active
+            active = np.flatnonzero(self.drivers.status == ACTIVE)
+            if not len(active):
+                return None
+            event = self.generate_ping(self.drivers.driver_ids[int(self.rng.choice(active))].as_py())
+        elif event_type == "trip":
+            event = self.generate_trip_event()
+        elif event_type == "surge":
+            event = self.generate_surge_event()
+        else:
+            raise ValueError(f"Unknown event type: {event_type}")
+        if METRICS_ENABLED and event is not None:
+            EVENTS.inc(event_type)
+        return event
+
+    def generate_batch(self, event_type: str, count: int):
+        # count events as one pa.RecordBatch, stamped once per batch, no pydantic models
+        if event_type not in ("ping", "trip", "surge"):
+            raise ValueError(f"Unknown event type: {event_type}")
+        with timer(BATCH_SECONDS, event_type):
+            batch = self._build_batch(event_type, count)
+        if METRICS_ENABLED:
+            EVENTS.inc(event_type, amount=batch.num_rows)
+        return batch
+
+    def _build_batch(self, event_type, count):
+        if event_type == "ping":
+            return self.generate_pings_batch(count)
+        timestamp = utc_now_iso()
+        if event_type == "trip":
+            records = [self.next_trip_record(timestamp) for _ in range(count)]
+            return pa.RecordBatch.from_pylist(records, schema=TRIP_SCHEMA)
+        if event_type == "surge":
+            records = [self.next_surge_record(timestamp) for _ in range(count)]
+            return pa.RecordBatch.from_pylist([r for r in records if r], schema=SURGE_SCHEMA)
 
     def run_simulation(self, event_type: str, count: int = 1):
+        # Unpaced; use stream()/run_simulation_async() to pace on the event loop
         events = []
         for _ in range(count):
-            if event_type == "ping":
-                driver_id = random.choice(self.state["drivers"])
-                event = self.generate_ping(driver_id)
-            elif event_type == "trip":
-                event = self.generate_trip_event()
-            elif event_type == "surge":
-                event = self.generate_surge_event()
+            event = self.generate(event_type)
             if event:
                 events.append(event)
-            time.sleep(random.uniform(0.2, 1.0))  # Simulate interval
-        return events
\ No newline at end of file
+        return events
+
+    async def _generate_async(self, event_type):
+        # Generation is in-process and short, so it runs on the event loop; see ShardedSimulator
+        return self.generate(event_type)
+
+    async def _generate_batch_async(self, event_type, count):
+        return self.generate_batch(event_type, count)
+
+    async def stream(self, event_type: str, count: Optional[int] = None, pacer: Optional[Pacer] = None):
+        # count event slots like run_simulation and stream_batches; None streams forever
+        pacer = pacer or Pacer()
+        attempts = 0
+        while count is None or attempts < count:
+            await pacer.wait()
+            attempts += 1
+            event = await self._generate_async(event_type)
+            if event:
+                yield event
+
+    async def stream_batches(self, event_type: str, count: Optional[int] = None, pacer: Optional[Pacer] = None,
+                             chunk_size: int = 1000):
+        # Bulk mode emits chunk_size-event batches; paced mode one event per token; None streams forever
+        pacer = pacer or Pacer()
+        if pacer.rate:
+            chunk_size = 1
+        remaining = count
+        while remaining is None or remaining > 0:
+            n = chunk_size if remaining is None else min(chunk_size, remaining)
+            for _ in range(n):
+                await pacer.wait()
+            yield await self._generate_batch_async(event_type, n)
+            if remaining is not None:
+                remaining -= n
+
+    async def run_simulation_async(self, event_type: str, count: int = 1, pacer: Optional[Pacer] = None):
+        return [event async for event in self.stream(event_type, count, pacer)]
@@ -0,0 +1,93 @@
+import numpy as np
+import h3
+from .driver_store import ACTIVE
+
+MAX_RING = 10  # ~9 km at resolution 8 before falling back to a city-wide pick
+
+
+class AvailableDriverIndex:
+    # Available drivers bucketed by H3 cell. Entries are invalidated lazily: a
+    # lookup drops any driver that is no longer active or has left the cell,
+    # so match/cancel/dropoff/ping only ever append.
+    def __init__(self, store, max_ring=MAX_RING):
+        self.store = store
+        self.max_ring = max_ring
+        self._rings = {}  # (cell_id, k) → cell ids at exactly distance k
+        self.rebuild()
+
+    def rebuild(self):
+        # Sorted (cell, driver) runs; O(fleet) but vectorized and only after bulk moves
+        available = np.flatnonzero(self.store.status == ACTIVE)
+        self._drivers = available[np.argsort(self.store.cell[available], kind="stable")]
+        self._cells = self.store.cell[self._drivers]
+        self._run_cell = np.full(len(self.store.status), -1, dtype=self._cells.dtype)  # Driver → cell in the run
+        self._run_cell[self._drivers] = self._cells
+        self._added = {}  # cell_id → drivers that became available there since the rebuild
+        self._filed = set()  # (driver, cell) pairs in _added
+        self._n_added = 0
+        self._stale = False
+
+    def invalidate(self):
+        # Many drivers moved at once (batched pings): rebuild on the next lookup
+        self._stale = True
+
+    def add(self, i):
+        # Driver i is available in its current cell (dropoff, cancel, or a ping move)
+        if self._stale:
+            return
+        i, cell = int(i), int(self.store.cell[i])
+        # Entries are never removed, so one filed under this cell is valid again: filing it
+        # twice would make the driver twice as likely to be picked
+        if self._run_cell[i] == cell or (i, cell) in self._filed:
+            return
+        self._filed.add((i, cell))
+        self._added.setdefault(cell, []).append(i)
+        self._n_added += 1
+        if self._n_added > max(1024, len(self._drivers)):
+            self._stale = True  # Cheaper to re-sort than to keep scanning overflow lists
+
+    def _ring(self, cell_id, k):
+        key = (cell_id, k)
+        ring = self._rings.get(key)
+        if ring is None:
+            cells = self.store.cells
+            origin = cells.ids[cell_id]
+            try:
+                members = h3.grid_ring(origin, k)
+            except h3.H3BaseException:  # Pentagon distortion: take the disk difference
+                members = set(h3.grid_disk(origin, k)) - set(h3.grid_disk(origin, k - 1))
+            ring = np.array(sorted(cells.intern(c) for c in members), dtype=np.int32)
+            self._rings[key] = ring
+        return ring
+
+    def _candidates(self, ring):
+        lo = np.searchsorted(self._cells, ring, side="left")
+        hi = np.searchsorted(self._cells, ring, side="right")
+        hit = hi > lo
+        drivers = [self._drivers[a:b] for a, b in zip(lo[hit], hi[hit])]
+        # Each entry is only valid if the driver is still active in the cell it was filed under
+        expected = [np.repeat(ring[hit], (hi - lo)[hit])] if drivers else []
+        for c in ring.tolist():
+            added = self._added.get(c)
+            if added:
+                drivers.append(np.array(added))
+                expected.append(np.full(len(added), c))
+        if not drivers:
+            return drivers
+        candidates, expected = np.concatenate(drivers), np.concatenate(expected)
+        valid = (self.store.status[candidates] == ACTIVE) & (self.store.cell[candidates] == expected)
+        return candidates[valid]
+
+    def nearest(self, cell_id, rng, fallback=True):
+        # Random available driver from the closest non-empty ring around cell_id;
+        # fallback=False returns None rather than picking anywhere in the city
+        if self._stale:
+            self.rebuild()
+        for k in range(self.max_ring + 1):
+            candidates = self._candidates(self._ring(cell_id, k))
+            if len(candidates):
+                return int(rng.choice(candidates))
+        if not fallback:
+            return None
+        available = np.flatnonzero(self.store.status == ACTIVE)
+        return int(rng.choice(available)) if len(available) else None
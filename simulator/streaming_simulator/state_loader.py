@@ -1,57 +1,127 @@
+import ast
+import hashlib
+import os
+import shutil
+import numpy as np
 import pandas as pd
-import random
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
 
-DATA_DIR = Path(__file__).resolve().parent / ".." / ".." / "data_samples"
+# SIM_DATA_DIR points the simulator at another batch output (e.g. a benchmark scale factor)
+DATA_DIR = Path(os.environ.get("SIM_DATA_DIR", Path(__file__).resolve().parent / ".." / ".." / "data_samples"))
+# Compiled state, one subdir per hash of the source Parquet files
+SNAPSHOT_DIR = DATA_DIR / ".state_snapshot"
 
-def load_state():
-    required_files = [
-        "zones.parquet",
-        "vehicles.parquet",
-        "riders.parquet",
-        "drivers.parquet",
-    ]
-    missing = [f for f in required_files if not (DATA_DIR / f).exists()]
+REQUIRED_FILES = [
+    "zones.parquet",
+    "vehicles.parquet",
+    "riders.parquet",
+    "drivers.parquet",
+]
+
+def _source_files(name):
+    # Sharded batch output is a directory of part files
+    path = DATA_DIR / name
+    return sorted(path.rglob("*.parquet")) if path.is_dir() else [path]
+
+def source_hash():
+    digest = hashlib.sha256()
+    for name in REQUIRED_FILES:
+        for path in _source_files(name):
+            digest.update(str(path.relative_to(DATA_DIR)).encode())
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()[:16]
+
+def zone_centroids(zones_df):
+    # Vertex mean per polygon; O(zones), done once instead of once per driver
+    polygons = [np.asarray(ast.literal_eval(p)) for p in zones_df["polygon"]]
+    centroids = np.array([p.mean(axis=0) for p in polygons]).reshape(-1, 2)
+    return centroids[:, 0], centroids[:, 1]
+
+def build_driver_table(zones_df, drivers_df, seed=42):
+    # Driver state: current position (init from home_zone)
+    lat, lng = zone_centroids(zones_df)
+    zones = pd.DataFrame({
+        "home_zone_id": zones_df["zone_id"],
+        "h3_index": zones_df["h3_index"],
+        "centroid_lat": lat,
+        "centroid_lng": lng,
+    })
+    joined = drivers_df[["driver_id", "status", "current_vehicle_id", "home_zone_id"]].merge(
+        zones, on="home_zone_id", how="left", validate="many_to_one")
+    if joined["h3_index"].isna().any():
+        missing = joined.loc[joined["h3_index"].isna(), "home_zone_id"].unique()[:5]
+        raise ValueError(f"Drivers reference unknown home zones: {', '.join(map(str, missing))}")
+    rng = np.random.default_rng(seed)
+    n = len(joined)
+    return pa.table({
+        "driver_id": pa.array(joined["driver_id"], pa.string()),
+        "status": pa.array(joined["status"], pa.string()),
+        "vehicle_id": pa.array(joined["current_vehicle_id"], pa.string(), from_pandas=True),
+        "current_lat": joined["centroid_lat"].to_numpy() + rng.uniform(-0.01, 0.01, n),  # Small jitter
+        "current_lng": joined["centroid_lng"].to_numpy() + rng.uniform(-0.01, 0.01, n),
+        "h3_index": pa.array(joined["h3_index"], pa.string()),
+    })
+
+def _build_tables():
+    zones_df = pd.read_parquet(DATA_DIR / "zones.parquet")
+    drivers_df = pd.read_parquet(DATA_DIR / "drivers.parquet")
+    return {
+        "zones": pa.Table.from_pandas(zones_df, preserve_index=False),
+        "vehicles": pq.read_table(DATA_DIR / "vehicles.parquet", columns=["vehicle_id"]),
+        "riders": pq.read_table(DATA_DIR / "riders.parquet", columns=["rider_id"]),
+        "drivers": build_driver_table(zones_df, drivers_df),
+    }
+
+def _write_snapshot(path, tables):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    for name, table in tables.items():
+        with pa.OSFile(str(tmp / f"{name}.arrow"), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # Another worker published it first
+    # Drop snapshots of older source files
+    for stale in SNAPSHOT_DIR.iterdir():
+        if stale != path and not stale.name.endswith(".tmp"):
+            shutil.rmtree(stale, ignore_errors=True)
+
+def _read_snapshot(path):
+    # Memory-mapped: pages are shared across uvicorn workers and loaded lazily
+    return {
+        name: pa.ipc.open_file(pa.memory_map(str(path / f"{name}.arrow"))).read_all()
+        for name in ("zones", "vehicles", "riders", "drivers")
+    }
+
+def load_tables(use_snapshot=True):
+    missing = [f for f in REQUIRED_FILES if not (DATA_DIR / f).exists()]
     if missing:
         raise FileNotFoundError(
             f"Missing data files: {', '.join(missing)}. "
             "Run the batch generator: python simulator/batch_generator/main_batch.py"
         )
-
-    zones_df = pd.read_parquet(DATA_DIR / "zones.parquet")
-    vehicles_df = pd.read_parquet(DATA_DIR / "vehicles.parquet")
-    riders_df = pd.read_parquet(DATA_DIR / "riders.parquet")
-    drivers_df = pd.read_parquet(DATA_DIR / "drivers.parquet")
     # Optional: Load historical for baseline, but not needed for live sim
+    if not use_snapshot:
+        return _build_tables()
+    path = SNAPSHOT_DIR / source_hash()
+    if not path.exists():
+        _write_snapshot(path, _build_tables())
+    return _read_snapshot(path)
 
-    # Pools for quick access
-    zone_pool = zones_df.to_dict(orient="records")
-    vehicle_pool = list(vehicles_df["vehicle_id"])
-    rider_pool = list(riders_df["rider_id"])
-    driver_pool = list(drivers_df["driver_id"])
-
-    # Driver state: current position (init from home_zone)
-    driver_states = {}
-    for _, driver in drivers_df.iterrows():
-        home_zone = next(z for z in zone_pool if z["zone_id"] == driver["home_zone_id"])
-        # Parse polygon str back to list of tuples
-        polygon = eval(home_zone["polygon"])  # Safe since we control it
-        # Init pos: random point in polygon (simple centroid approx)
-        lats, lngs = zip(*polygon)
-        init_lat = sum(lats) / len(lats)
-        init_lng = sum(lngs) / len(lngs)
-        driver_states[driver["driver_id"]] = {
-            "status": driver["status"],
-            "vehicle_id": driver["current_vehicle_id"],
-            "current_lat": init_lat + random.uniform(-0.01, 0.01),  # Small jitter
-            "current_lng": init_lng + random.uniform(-0.01, 0.01),
-            "h3_index": home_zone["h3_index"]
-        }
+def load_state(use_snapshot=True):
+    tables = load_tables(use_snapshot)
 
+    # Pools for quick access; per-driver state stays columnar (see driver_store.DriverStore)
     return {
-        "zones": zone_pool,
-        "vehicles": vehicle_pool,
-        "riders": rider_pool,
-        "drivers": driver_pool,
-        "driver_states": driver_states
-    }
\ No newline at end of file
+        "zones": tables["zones"].to_pylist(),
+        "vehicles": tables["vehicles"]["vehicle_id"].to_pylist(),
+        "riders": tables["riders"]["rider_id"].to_pylist(),
+        "drivers": tables["drivers"]["driver_id"].to_pylist(),
+        "driver_table": tables["drivers"]
+    }
@@ -0,0 +1,111 @@
+import os
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import h3
+
+NEIGHBOR_RESOLUTION = 6  # Zones whose res-6 parents are within one ring are neighbors (~10 km)
+# Seconds per surge step: virtual seconds in discrete trip mode, wall seconds in random mode
+TICK_SECONDS = float(os.environ.get("SIM_SURGE_TICK_SECONDS", 1.0))
+# Mean requests per zone per tick from riders outside the simulated trips, so demand moves
+# (and surge events flow) without trip traffic; each adds REQUEST_DEMAND like a trip request
+BACKGROUND_RATE = float(os.environ.get("SIM_SURGE_BACKGROUND_RATE", 0.05))
+REQUEST_DEMAND = 0.1
+MAX_CATCHUP_TICKS = 60  # After a long gap, older ticks only decay demand rather than being replayed
+
+
+class SurgeEngine:
+    # Demand for every zone lives in one array. Each tick applies decay, the inflow
+    # recorded since the last tick, and neighbor smoothing city-wide in one
+    # vectorized step, then reports only zones whose multiplier moved by >= threshold.
+    # Ticks are due every tick_seconds on clock (the simulation's virtual clock, or wall
+    # time), however often events are requested.
+    def __init__(self, zones, decay=0.99, smoothing=0.2, threshold=0.1, baseline=1.0, rng=None,
+                 background_rate=BACKGROUND_RATE, tick_seconds=TICK_SECONDS, clock=time.monotonic):
+        self.zone_ids = [z["zone_id"] for z in zones]
+        self.index = {zone_id: i for i, zone_id in enumerate(self.zone_ids)}
+        self._zone_array = pa.array(self.zone_ids, pa.string())
+        self.decay = decay
+        self.smoothing = smoothing
+        self.threshold = threshold
+        self.baseline = baseline
+        n = len(self.zone_ids)
+        self.demand = np.full(n, baseline)
+        self.inflow = np.zeros(n)
+        self.multiplier = np.ones(n)  # Last emitted multiplier per zone
+        self.rng = rng or np.random.default_rng()
+        # Per-zone background rate; lognormal popularity (mean 1) keeps a few zones hot enough to surge
+        self.background = background_rate * self.rng.lognormal(-0.5, 1.0, n)
+        # Start from the background's steady state instead of warming up from flat demand
+        self.demand += self.background * REQUEST_DEMAND / (1 - decay)
+        self.tick_seconds = tick_seconds
+        self.clock = clock
+        self._last_tick = clock()
+        self._rows, self._cols = self._neighbor_pairs([z["h3_index"] for z in zones])
+        self._degree = np.bincount(self._rows, minlength=n)
+
+    @staticmethod
+    def _neighbor_pairs(cells):
+        # Sparse (zone, neighbor) pairs, built once from coarse parent cells
+        parents = [h3.cell_to_parent(c, NEIGHBOR_RESOLUTION) for c in cells]
+        by_parent = {}
+        for i, parent in enumerate(parents):
+            by_parent.setdefault(parent, []).append(i)
+        rows, cols = [], []
+        for i, parent in enumerate(parents):
+            for near in h3.grid_disk(parent, 1):
+                for j in by_parent.get(near, ()):
+                    if j != i:
+                        rows.append(i)
+                        cols.append(j)
+        return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+    def record_demand(self, zone_id, amount=REQUEST_DEMAND):
+        i = self.index.get(zone_id)
+        if i is not None:  # Zones owned by another shard are that shard's to track
+            self.inflow[i] += amount
+
+    def record_demand_batch(self, zone_ids, amount=REQUEST_DEMAND):
+        # record_demand for a whole Arrow column of zone ids, one request each
+        i = pc.fill_null(pc.index_in(zone_ids, value_set=self._zone_array), -1).to_numpy()
+        np.add.at(self.inflow, i[i >= 0], amount)
+
+    @staticmethod
+    def multiplier_for(demand):
+        # Flat below 1.5, then 1.2x rising linearly to a 3.0x cap
+        return np.where(demand < 1.5, 1.0, np.clip(1.2 + (demand - 1.5) * 0.6, 1.2, 3.0)).round(2)
+
+    @property
+    def next_tick(self):
+        # Clock time the next tick falls due
+        return self._last_tick + self.tick_seconds
+
+    def advance(self):
+        # Runs the ticks due by the clock; returns (tick time, changes) for each, oldest first
+        due = int((self.clock() - self._last_tick) // self.tick_seconds)
+        if due <= 0:
+            return []
+        skipped = max(due - MAX_CATCHUP_TICKS, 0)
+        # Skipped ticks still decay demand, so decay follows elapsed time, not ticks run
+        self.demand = self.baseline + (self.demand - self.baseline) * self.decay ** skipped
+        self._last_tick += skipped * self.tick_seconds
+        ticks = []
+        for _ in range(due - skipped):
+            self._last_tick += self.tick_seconds
+            ticks.append((self._last_tick, self.tick()))
+        return ticks
+
+    def tick(self):
+        # One city-wide step; returns (zone indices, multipliers, demand) that changed
+        self.inflow += self.rng.poisson(self.background) * REQUEST_DEMAND
+        demand = self.baseline + (self.demand - self.baseline) * self.decay + self.inflow
+        self.inflow[:] = 0.0
+        neighbor_sum = np.bincount(self._rows, weights=demand[self._cols], minlength=len(demand))
+        has_neighbors = self._degree > 0
+        neighbor_mean = np.where(has_neighbors, neighbor_sum / np.maximum(self._degree, 1), demand)
+        self.demand = (1 - self.smoothing) * demand + self.smoothing * neighbor_mean
+        multiplier = self.multiplier_for(self.demand)
+        changed = np.flatnonzero(np.abs(multiplier - self.multiplier) >= self.threshold - 1e-9)
+        self.multiplier[changed] = multiplier[changed]
+        return changed, self.multiplier[changed], self.demand[changed]
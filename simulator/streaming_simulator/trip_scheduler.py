@@ -0,0 +1,70 @@
+import heapq
+import itertools
+from datetime import datetime, timedelta
+
+# Mean virtual seconds a trip spends in each state before its next transition
+MEAN_STATE_SECONDS = {
+    "requested": 60,   # request → matched
+    "matched": 300,    # matched → pickup
+    "pickup": 900,     # pickup → dropoff/cancel; avg 15 min like the batch trips
+}
+REQUEST = None  # Heap entries without a trip_id are request arrivals
+DRIVER_HOLD_SECONDS = MEAN_STATE_SECONDS["matched"] + MEAN_STATE_SECONDS["pickup"]  # Match to dropoff
+TARGET_UTILIZATION = 0.6  # Share of active drivers on a trip at the default request rate
+
+
+def default_request_rate(n_active):
+    # Little's law: drivers busy = rate x hold time. A fixed rate either saturates a small
+    # fleet (most requests then cancel unmatched) or idles a large one.
+    return max(TARGET_UTILIZATION * n_active / DRIVER_HOLD_SECONDS, 1e-3)
+
+
+class VirtualClock:
+    # Simulation time in seconds since start; only moves as the simulation runs, never with wall time
+    def __init__(self, start=None):
+        self.start = start or datetime.utcnow()
+        self.t = 0.0
+
+    def advance_to(self, t):
+        self.t = max(self.t, t)
+
+    def now(self, t=None):
+        return self.start + timedelta(seconds=self.t if t is None else t)
+
+    def iso(self, t=None):
+        return self.now(t).isoformat(timespec="microseconds") + "Z"  # Fixed width, so ISO strings sort by time
+
+
+class TripScheduler:
+    # Priority queue of pending lifecycle transitions. Requests arrive as a Poisson
+    # process; each transition schedules the next with an exponential delay, so
+    # events pop in event_time order at O(log n) regardless of active trip count.
+    def __init__(self, rng, request_rate=5.0, clock=None):
+        self.rng = rng
+        self.request_rate = request_rate  # Requests per virtual second
+        self.clock = clock or VirtualClock()
+        self._heap = []
+        self._seq = itertools.count()  # Tie-breaker keeps pops deterministic
+        self.schedule_request()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _push(self, delay, trip_id):
+        heapq.heappush(self._heap, (self.clock.t + delay, next(self._seq), trip_id))
+
+    def schedule_request(self):
+        self._push(self.rng.exponential(1 / self.request_rate), REQUEST)
+
+    def schedule(self, trip_id, state):
+        self._push(self.rng.exponential(MEAN_STATE_SECONDS[state]), trip_id)
+
+    def peek(self):
+        # Virtual time of the next due transition
+        return self._heap[0][0]
+
+    def pop(self):
+        # Next due trip_id (or REQUEST); advances the virtual clock to its time
+        t, _, trip_id = heapq.heappop(self._heap)
+        self.clock.advance_to(t)
+        return trip_id